@@ -1,23 +1,85 @@
+import os
 import time
-import json
+import requests
+from dotenv import load_dotenv
+from config_store import get_store
 
-CONFIG_FILE = "form_data.json"
+# Load environment variables from a .env file
+load_dotenv()
+
+# Seconds between heartbeats sent to the server
+HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", "10"))
+
+# Renew the lease receipt when it expires within this many seconds
+RENEW_BEFORE = int(os.getenv("RENEW_BEFORE", "3600"))
 
 def load_config():
     """
     Načíta konfiguráciu.
     """
-    with open(CONFIG_FILE, "r") as f:
-        return json.load(f)
+    return get_store().load()
+
+def receipt_headers(config):
+    """
+    Hlavičky s podpísaným potvrdením o prenájme (lease receipt), ak ho agent má.
+    """
+    return {"X-DRTA-Receipt": config["receipt"]} if config.get("receipt") else {}
+
+def renew_receipt(config):
+    """
+    Obnoví lease receipt na serveri.
+    """
+    url = os.getenv("RENEW_URL", "https://drta-server/renew")
+    try:
+        response = requests.post(url, headers=receipt_headers(config), verify=False)  # Added verify=False for testing
+        if response.status_code == 200:
+            # Merge only the renewed receipt into the file; the in-memory config may be stale
+            # and saving it whole would drop concurrent writes by register.py or form.py
+            fresh = get_store().update(response.json())
+            config.clear()
+            config.update(fresh)
+            print("[INFO] Lease receipt renewed.")
+            return True
+        print(f"[ERROR] Receipt renewal rejected: {response.status_code} - {response.text}")
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] Receipt renewal failed: {e}")
+    return False
+
+def send_heartbeat(config):
+    """
+    Pošle heartbeat na server.
+    """
+    url = os.getenv("HEARTBEAT_URL", "https://drta-server/heartbeat")
+    if config.get("receipt") and config.get("receipt_expires", 0) - time.time() < RENEW_BEFORE:
+        renew_receipt(config)
+    try:
+        response = requests.post(url, json={"unique_id": config["unique_id"]},
+                                 headers=receipt_headers(config), verify=False)  # Added verify=False for testing
+        if response.status_code == 200:
+            print("Connection alive...")
+        elif response.status_code == 401 and config.get("receipt"):
+            print(f"[ERROR] Heartbeat receipt rejected: {response.text}")
+            renew_receipt(config)
+        else:
+            print(f"[ERROR] Heartbeat rejected: {response.status_code} - {response.text}")
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] Heartbeat failed: {e}")
 
 def maintain_connection(config):
     """
-    Simuluje udržiavanie spojenia so serverom.
+    Udržiava spojenie so serverom.
     """
-    print(f"Maintaining connection for device '{config['device_name']}' with MAC: {config['mac_address']}")
+    print(f"Maintaining connection for device '{config['device_name']}' with ID: {config.get('unique_id')}")
+    store = get_store()
     while True:
-        print("Connection alive...")
-        time.sleep(10)
+        # Pick up registrations or renewals written by other processes; unchanged files are not re-read
+        if store.changed():
+            config = load_config()
+        if config.get("unique_id"):
+            send_heartbeat(config)
+        else:
+            print("[INFO] Device is not registered yet. Run the registration script first.")
+        time.sleep(HEARTBEAT_INTERVAL)
 
 def main():
     """
@@ -0,0 +1,166 @@
+import os
+import copy
+import json
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+# Directory of the client scripts; form_data.json lives next to them
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default client configuration file shared by form, register, agent and main
+CONFIG_FILE = os.path.join(SCRIPT_DIR, "form_data.json")
+
+# Number of rotated backups kept next to the configuration file
+BACKUP_COUNT = int(os.getenv("CONFIG_BACKUP_COUNT", "3"))
+
+class ConfigStore:
+    """
+    Cached, atomically written JSON configuration file.
+
+    Reads are served from memory as long as the file's inode, mtime and size are unchanged.
+    Writes go to a temporary file that is renamed over the original, so readers see either
+    the old or the new content, never a truncated file. The previous versions are kept as
+    <file>.bak.1 (newest) up to <file>.bak.N. Writers hold an exclusive lock on <file>.lock,
+    so concurrent updates from several scripts are merged instead of overwriting each other.
+    """
+
+    def __init__(self, path=CONFIG_FILE, backups=BACKUP_COUNT):
+        """
+        :param path: Path of the JSON configuration file.
+        :param backups: Number of backups to keep.
+        """
+        self.path = path
+        self.backups = backups
+        self._data = None
+        self._signature = None
+        self._lock_depth = 0
+
+    @contextmanager
+    def _locked(self):
+        # Re-entrant within the store: update() holds the lock across its load and save
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def changed(self):
+        """
+        :return: True if the file changed (or appeared/disappeared) since it was last read or written.
+        """
+        return self._data is None or self._stat_signature() != self._signature
+
+    def load(self):
+        """
+        Return the configuration, re-reading the file only if it changed.
+
+        :return: Copy of the configuration data.
+        :raises FileNotFoundError: If the configuration file does not exist.
+        """
+        signature = self._stat_signature()
+        if signature is None:
+            self._data, self._signature = None, None
+            raise FileNotFoundError(self.path)
+        if self._data is None or signature != self._signature:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            # The signature is taken before reading; if the file is replaced meanwhile, the next load re-reads it
+            self._data, self._signature = data, signature
+        return copy.deepcopy(self._data)
+
+    def _rotate_backups(self):
+        if self.backups <= 0 or not os.path.exists(self.path):
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.bak.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.bak.{index + 1}")
+        newest = f"{self.path}.bak.1"
+        try:
+            # The current file is about to be replaced by rename, so a hard link preserves it without copying
+            os.link(self.path, newest)
+        except FileExistsError:
+            os.unlink(newest)
+            os.link(self.path, newest)
+        except OSError:
+            shutil.copy2(self.path, newest)
+
+    def save(self, data):
+        """
+        Atomically replace the configuration file with the given data.
+
+        :param data: Data to save in JSON format.
+        """
+        with self._locked():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w") as tmp_file:
+                    json.dump(data, tmp_file, indent=4)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                if os.path.exists(self.path):
+                    shutil.copymode(self.path, tmp_path)
+                self._rotate_backups()
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            try:
+                # Persist the rename itself
+                dir_fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            except OSError:
+                pass
+            self._data, self._signature = copy.deepcopy(data), self._stat_signature()
+
+    def update(self, changes):
+        """
+        Merge changes into the stored configuration and save it, under the store lock so that
+        changes written by another process in the meantime are kept.
+
+        :param changes: Keys and values to set.
+        :return: Updated configuration data.
+        """
+        with self._locked():
+            data = self.load()
+            data.update(changes)
+            self.save(data)
+        return data
+
+_stores = {}
+
+def get_store(path=CONFIG_FILE):
+    """
+    Return the shared ConfigStore for a path, so every module in the process uses one cache.
+
+    :param path: Path of the JSON configuration file.
+    :return: ConfigStore instance.
+    """
+    path = os.path.abspath(path)
+    if path not in _stores:
+        _stores[path] = ConfigStore(path)
+    return _stores[path]
@@ -1,7 +1,7 @@
 import os
 import subprocess
 import json
-import shutil
+from config_store import get_store, SCRIPT_DIR
 
 # Define the directory for SSH keys
 SSH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ssh")
@@ -30,6 +30,7 @@ def generate_ssh_key(filename, comment):
 
     :param filename: Name of the key file to be created.
     :param comment: Comment associated with the key for identification.
+    :return: Path of the private key or None if generation failed.
     """
     try:
         key_path = os.path.join(SSH_DIR, filename)
@@ -37,30 +38,39 @@ def generate_ssh_key(filename, comment):
         key_cmd = ["ssh-keygen", "-t", "ed25519", "-C", comment, "-f", key_path, "-N", ""]
         subprocess.run(key_cmd, check=True)
         print(f"[INFO] SSH key generated and saved to {key_path}")
+        return key_path
     except subprocess.CalledProcessError as e:
         print(f"[ERROR] Error generating SSH key: {e}")
+        return None
+
+# Function to read the public half of a generated SSH key
+def load_public_key(key_path):
+    """
+    Read the public key that ssh-keygen wrote next to the private key.
+
+    :param key_path: Path of the private key.
+    :return: Public key line or None if it cannot be read.
+    """
+    try:
+        with open(key_path + ".pub", "r") as pub_file:
+            return pub_file.read().strip()
+    except Exception as e:
+        print(f"[ERROR] Error reading SSH public key: {e}")
+        return None
 
 # Function to save data to a JSON file with backup
 def save_to_json(data, filename="form_data.json"):
     """
     Save the given data to a JSON file in the script's directory.
-    Creates a backup of the existing file if it exists.
+    The file is replaced atomically and the previous version is kept in a bounded backup rotation.
 
     :param data: Data to save in JSON format.
     :param filename: Name of the JSON file to save to.
     """
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, filename)
-        
-        if os.path.exists(file_path):
-            backup_filename = file_path + ".bak"
-            shutil.copy(file_path, backup_filename)
-            print(f"[INFO] Backup of existing file created: {backup_filename}")
-        
+        file_path = os.path.join(SCRIPT_DIR, filename)
         print(f"[DEBUG] Saving data to {file_path}")
-        with open(file_path, "w") as json_file:
-            json.dump(data, json_file, indent=4)
+        get_store(file_path).save(data)
         print(f"[INFO] Data saved to {file_path}")
     except Exception as e:
         print(f"[ERROR] Error saving data: {e}")
@@ -72,7 +82,7 @@ def load_prefixes():
 
     :return: List of prefixes or default prefixes if the file is not found.
     """
-    default_prefixes = ["fd:fc:fb:fa::/48", "fd:ab:cd:ef::/48", "Custom"]
+    default_prefixes = ["fd:fc:fb:fa::/48", "fd:ab:cd:ef::/48", "auto", "Custom"]
     try:
         with open(CONFIG_FILE, "r") as config_file:
             config = json.load(config_file)
@@ -92,15 +102,12 @@ def load_existing_json(filename="form_data.json"):
     :param filename: Name of the JSON file to load.
     :return: Loaded data or None if the file does not exist or an error occurs.
     """
+    file_path = os.path.join(SCRIPT_DIR, filename)
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, filename)
-
         print(f"[DEBUG] Attempting to load existing configuration from {file_path}")
-        with open(file_path, "r") as json_file:
-            data = json.load(json_file)
-            print(f"[INFO] Loaded existing configuration from {file_path}")
-            return data
+        data = get_store(file_path).load()
+        print(f"[INFO] Loaded existing configuration from {file_path}")
+        return data
     except FileNotFoundError:
         print(f"[INFO] No existing configuration found at {file_path}.")
         return None
@@ -155,7 +162,8 @@ def main():
 
     # Generate SSH key
     key_filename = f"{device_name}_id_ed25519"
-    generate_ssh_key(key_filename, device_name)
+    key_path = generate_ssh_key(key_filename, device_name)
+    ssh_public_key = load_public_key(key_path) if key_path else None
 
     # Save data
     data = {
@@ -163,7 +171,8 @@ def main():
         "ipv6_prefix": ipv6_prefix,
         "port": port,
         "location": location,
-        "function": function
+        "function": function,
+        "ssh_public_key": ssh_public_key
     }
     save_to_json(data)
 
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+
+import httpx
+import pyotp
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Simulated agent fleet for capacity testing of the DRTA server.
+# Every virtual agent follows the register.py / agent.py flow: verify TOTP, upload its
+# form data, then send heartbeats and periodically reconnect (verify TOTP again).
+
+def percentile(values, fraction):
+    """
+    Return the value at the given fraction (0-1) of the sorted values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Stats:
+    """
+    Collects request latencies and errors per reporting window and in total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.window_started = self.started
+        self.window = defaultdict(list)
+        self.totals = Counter()
+        self.errors = Counter()
+        self.window_errors = Counter()
+
+    def record(self, operation, latency, error=None):
+        if error:
+            self.errors[f"{operation}:{error}"] += 1
+            self.window_errors[f"{operation}:{error}"] += 1
+        else:
+            self.window[operation].append(latency)
+            self.totals[operation] += 1
+
+    def report(self):
+        """
+        Print the current window (rates, p50/p99 latencies, errors) and start a new one.
+        """
+        now = time.perf_counter()
+        elapsed = now - self.window_started
+        parts = [f"[{now - self.started:7.1f}s]"]
+        for operation in ("totp", "register", "heartbeat"):
+            latencies = self.window.get(operation, [])
+            if latencies:
+                parts.append(f"{operation}: {len(latencies) / elapsed:7.1f}/s "
+                             f"p50 {percentile(latencies, 0.5) * 1000:6.1f} ms "
+                             f"p99 {percentile(latencies, 0.99) * 1000:6.1f} ms")
+        if self.window_errors:
+            parts.append("errors: " + ", ".join(f"{name}={count}" for name, count in self.window_errors.most_common(5)))
+        print(" | ".join(parts), flush=True)
+        self.window = defaultdict(list)
+        self.window_errors = Counter()
+        self.window_started = now
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"\n[INFO] Finished after {elapsed:.1f} s")
+        for operation, count in sorted(self.totals.items()):
+            print(f"  {operation}: {count} ok ({count / elapsed:.1f}/s)")
+        for name, count in self.errors.most_common():
+            print(f"  error {name}: {count}")
+
+async def call(stats, operation, request):
+    """
+    Run one request coroutine, recording its latency or the kind of error it produced.
+    Returns:
+        httpx.Response or None if the request failed.
+    """
+    start = time.perf_counter()
+    try:
+        response = await request
+    except httpx.TimeoutException:
+        stats.record(operation, None, "timeout")
+        return None
+    except httpx.HTTPError as e:
+        stats.record(operation, None, type(e).__name__)
+        return None
+    latency = time.perf_counter() - start
+    if response.status_code != 200:
+        stats.record(operation, latency, f"http_{response.status_code}")
+        return None
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if isinstance(body, dict) and "error" in body:
+        stats.record(operation, latency, f"app:{body['error']}")
+        return None
+    stats.record(operation, latency)
+    return response
+
+async def virtual_agent(index, client, args, totp, stats, deadline):
+    """
+    Simulate one agent: verify TOTP, register, then heartbeat and reconnect until the deadline.
+    """
+    form_data = {
+        "device_name": f"loadgen-{args.run_id}-{index:06d}",
+        "ipv6_prefix": args.prefix,
+        "port": "22",
+        "location": f"loadgen-site{index % args.locations}",
+        "function": random.choice(["gateway", "sensor", "camera", "router"]),
+    }
+
+    registered = None
+    while registered is None and time.perf_counter() < deadline:
+        if await call(stats, "totp", client.post("/verify-totp", json={"code": totp.now()})) is None:
+            await asyncio.sleep(args.retry_delay)
+            continue
+        files = {"file": ("form_data.json", json.dumps(form_data), "application/json")}
+        response = await call(stats, "register", client.post("/process-form-data", files=files))
+        if response is None:
+            await asyncio.sleep(args.retry_delay)
+            continue
+        result = response.json()
+        registered = dict(result["data"], receipt=result.get("receipt"))
+
+    next_reconnect = time.perf_counter() + args.reconnect_interval if args.reconnect_interval else None
+    while registered is not None:
+        # Spread heartbeats so that agents do not fire in lockstep
+        await asyncio.sleep(args.heartbeat_interval * random.uniform(0.8, 1.2))
+        if time.perf_counter() >= deadline:
+            break
+        if next_reconnect and time.perf_counter() >= next_reconnect:
+            await call(stats, "totp", client.post("/verify-totp", json={"code": totp.now()}))
+            next_reconnect = time.perf_counter() + args.reconnect_interval
+        headers = {"X-DRTA-Receipt": registered["receipt"]} if registered.get("receipt") else {}
+        await call(stats, "heartbeat", client.post("/heartbeat", json={"unique_id": registered["unique_id"]},
+                                                   headers=headers))
+
+async def run(args):
+    secret = os.getenv("TOTP_SECRET")
+    if not secret:
+        raise SystemExit("TOTP_SECRET environment variable is required (shared test secret).")
+    totp = pyotp.TOTP(secret)
+    stats = Stats()
+    deadline = time.perf_counter() + args.duration
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.server, verify=False, limits=limits,
+                                 timeout=args.timeout) as client:
+        async def reporter():
+            while True:
+                await asyncio.sleep(args.report_interval)
+                stats.report()
+
+        reporter_task = asyncio.create_task(reporter())
+        agents = []
+        for index in range(args.agents):
+            agents.append(asyncio.create_task(virtual_agent(index, client, args, totp, stats, deadline)))
+            if args.spawn_rate:
+                await asyncio.sleep(1 / args.spawn_rate)
+        await asyncio.gather(*agents)
+        reporter_task.cancel()
+    stats.report()
+    stats.summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated agent fleet load generator for the DRTA server.")
+    parser.add_argument("--server", default=os.getenv("LOADGEN_SERVER", "https://localhost"), help="Server base URL.")
+    parser.add_argument("--agents", type=int, default=1000, help="Number of virtual agents.")
+    parser.add_argument("--spawn-rate", type=float, default=200, help="Agents started per second (0 = all at once).")
+    parser.add_argument("--duration", type=float, default=300, help="Test duration in seconds.")
+    parser.add_argument("--heartbeat-interval", type=float, default=30, help="Seconds between heartbeats per agent.")
+    parser.add_argument("--reconnect-interval", type=float, default=0,
+                        help="Seconds between reconnects (TOTP re-verification) per agent, 0 disables reconnects.")
+    parser.add_argument("--prefix", default="auto", help="IPv6 prefix requested at registration.")
+    parser.add_argument("--locations", type=int, default=50, help="Number of distinct simulated locations.")
+    parser.add_argument("--connections", type=int, default=200, help="Maximum concurrent HTTP connections.")
+    parser.add_argument("--timeout", type=float, default=10, help="Request timeout in seconds.")
+    parser.add_argument("--retry-delay", type=float, default=1, help="Seconds before retrying a failed registration.")
+    parser.add_argument("--report-interval", type=float, default=5, help="Seconds between progress reports.")
+    parser.add_argument("--run-id", default=str(int(time.time())), help="Suffix making device names unique per run.")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
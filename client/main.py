@@ -1,10 +1,8 @@
 import os
 import subprocess
-import json
 import sys
 import argparse
-
-CONFIG_FILE = "form_data.json"
+from config_store import get_store, CONFIG_FILE
 
 def run_form():
     """
@@ -32,8 +30,7 @@ def load_config():
     Načíta konfiguráciu z form_data.json.
     """
     try:
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
+        return get_store().load()
     except FileNotFoundError:
         print(f"Configuration file '{CONFIG_FILE}' not found.")
         return None
@@ -62,9 +59,7 @@ def exchange_keys_with_server(config):
         "ipv6": "fd:fc:fb:fa:0001::2"
     }
     config.update(server_response)
-
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
+    get_store().save(config)
 
     print("Registration complete. Server returned:")
     print(f"Port: {server_response['port']}")
@@ -2,10 +2,17 @@ import requests
 import json
 from dotenv import load_dotenv
 import os
+from config_store import get_store
 
 # Load environment variables from a .env file
 load_dotenv()
 
+# Server-assigned identity stored next to the form data; the allocated tunnel port is kept as
+# tunnel_port so it never replaces the device's local SSH port entered in form.py
+REGISTRATION_KEYS = {"unique_id": "unique_id", "ipv6_address": "ipv6_address", "port": "tunnel_port",
+                     "pool": "pool", "tunnel_host": "tunnel_host", "listen_host": "listen_host",
+                     "ssh_key_fingerprint": "ssh_key_fingerprint"}
+
 def verify_totp():
     # Retrieve the TOTP URL from environment variables or use the default
     url = os.getenv("TOTP_URL", "https://drta-server/verify-totp")
@@ -41,23 +48,25 @@ def verify_totp():
             print("Retrying...")
 
 def send_form_data():
-    file_path = "form_data.json"  # Path to the JSON file containing form data
+    store = get_store()  # Shared store of the form_data.json configuration
+    file_path = store.path  # Path to the JSON file containing form data
     upload_url = os.getenv("UPLOAD_URL", "https://drta-server/upload")  # Retrieve the upload URL from environment variables
     
     try:
         print(f"[DEBUG] Upload URL: {upload_url}")
         print(f"[DEBUG] File path: {file_path}")
 
-        # Open the JSON file in binary mode for upload
-        with open(file_path, "rb") as file:
-            files = {"file": file}  # Prepare the file payload
-            print(f"[DEBUG] Files payload prepared for upload.")
-            response = requests.post(upload_url, files=files, verify=False)  # Added verify=False for testing
+        # Serialize the stored configuration for upload
+        file_content = json.dumps(store.load()).encode("utf-8")
+        files = {"file": ("form_data.json", file_content, "application/json")}  # Prepare the file payload
+        print(f"[DEBUG] Files payload prepared for upload.")
+        response = requests.post(upload_url, files=files, verify=False)  # Added verify=False for testing
 
         # Handle the server's response
         print(f"[DEBUG] Upload response status: {response.status_code}, Response text: {response.text}")
         if response.status_code == 200:
             print("File uploaded successfully!")
+            save_registration(store, response.json())
         else:
             print(f"Failed to upload file. Server responded with: {response.status_code} - {response.text}")
     except FileNotFoundError:
@@ -67,6 +76,16 @@ def send_form_data():
         # Catch and report any network-related errors during file upload
         print(f"[ERROR] An exception occurred while uploading the file: {e}")
 
+def save_registration(store, result):
+    # Store the identity assigned by the server so the agent can use it for heartbeats
+    if "data" not in result:
+        print(f"[ERROR] Registration failed: {result.get('error', result)}")
+        return
+    registration = {key: result["data"][field] for field, key in REGISTRATION_KEYS.items() if field in result["data"]}
+    config = store.update(dict(registration, receipt=result.get("receipt"),
+                               receipt_expires=result.get("receipt_expires")))
+    print(f"[INFO] Registration saved: tunnel port {config.get('tunnel_port')}, IPv6 {config.get('ipv6_address')}")
+
 if __name__ == "__main__":
     print("[DEBUG] Starting TOTP verification process.")
     verify_totp()
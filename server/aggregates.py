@@ -0,0 +1,177 @@
+import logging
+
+logger = logging.getLogger("AggregatesLogger")
+
+# Device counts per (location, function, pool), maintained by triggers on client_data.
+# Rows without a pool are counted under the empty string, since NULLs never conflict in a primary key.
+COUNTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS client_counts (
+    location VARCHAR NOT NULL,
+    function VARCHAR NOT NULL,
+    pool VARCHAR NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (location, function, pool)
+)
+"""
+
+COUNTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS client_counts_ai AFTER INSERT ON client_data BEGIN
+        INSERT INTO client_counts(location, function, pool, count)
+        VALUES (new.location, new.function, COALESCE(new.pool, ''), 1)
+        ON CONFLICT(location, function, pool) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_counts_ad AFTER DELETE ON client_data BEGIN
+        UPDATE client_counts SET count = count - 1
+        WHERE location = old.location AND function = old.function AND pool = COALESCE(old.pool, '');
+        DELETE FROM client_counts WHERE count <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_counts_au AFTER UPDATE OF location, function, pool ON client_data BEGIN
+        UPDATE client_counts SET count = count - 1
+        WHERE location = old.location AND function = old.function AND pool = COALESCE(old.pool, '');
+        DELETE FROM client_counts WHERE count <= 0;
+        INSERT INTO client_counts(location, function, pool, count)
+        VALUES (new.location, new.function, COALESCE(new.pool, ''), 1)
+        ON CONFLICT(location, function, pool) DO UPDATE SET count = count + 1;
+    END
+    """,
+)
+
+RECOUNT_QUERY = """
+SELECT location, function, COALESCE(pool, ''), COUNT(*) FROM client_data
+GROUP BY location, function, COALESCE(pool, '')
+"""
+
+def counts_exist(conn):
+    """
+    Check whether the aggregate counter table has been created in the database.
+    Args:
+        conn: DBAPI connection to the database.
+    Returns:
+        bool: True if the client_counts table exists.
+    """
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='client_counts'"
+    ).fetchone()
+    return row is not None
+
+def install_aggregates(conn):
+    """
+    Create the aggregate counters and their triggers if they do not exist yet.
+    Freshly created counters are filled from the rows already in client_data.
+    Args:
+        conn: DBAPI connection to the database.
+    """
+    exists = counts_exist(conn)
+    conn.execute(COUNTS_SCHEMA)
+    for statement in COUNTS_TRIGGERS:
+        conn.execute(statement)
+    if not exists:
+        logger.info("Building fleet aggregates from existing client data...")
+        conn.execute(f"INSERT INTO client_counts(location, function, pool, count) {RECOUNT_QUERY}")
+    conn.commit()
+
+def backfill_pools(conn, pools):
+    """
+    Assign clients without a pool (registered before allocation pools existed, or imported from
+    such a registry) to the pool whose port range holds their port. The update trigger moves
+    their counts from the unpooled group to that pool.
+    Args:
+        conn: DBAPI connection to the database.
+        pools (list[Pool]): Configured allocation pools.
+    Returns:
+        int: Number of clients assigned to a pool.
+    """
+    assigned = 0
+    for pool in pools:
+        assigned += conn.execute(
+            "UPDATE client_data SET pool = ? WHERE pool IS NULL AND port > ? AND port <= ?",
+            (pool.name, pool.port_start, pool.port_end),
+        ).rowcount
+    return assigned
+
+def reconcile_counts(conn, pools=()):
+    """
+    Assign unpooled clients to their pool, recount client_data and replace the counters if they drifted.
+    Runs in its own write transaction so registrations cannot interleave with the recount.
+    Args:
+        conn: DBAPI connection to the database.
+        pools (list[Pool]): Configured allocation pools, used to backfill clients without a pool.
+    Returns:
+        int: Number of groups whose count was corrected.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage the write transaction explicitly
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        assigned = backfill_pools(conn, pools)
+        if assigned:
+            logger.info(f"Assigned {assigned} clients without a pool to the pool of their port.")
+        actual = {row[:3]: row[3] for row in conn.execute(RECOUNT_QUERY)}
+        stored = {row[:3]: row[3] for row in conn.execute(
+            "SELECT location, function, pool, count FROM client_counts"
+        )}
+        drifted = sum(1 for key in actual.keys() | stored.keys() if actual.get(key) != stored.get(key))
+        if drifted:
+            conn.execute("DELETE FROM client_counts")
+            conn.executemany(
+                "INSERT INTO client_counts(location, function, pool, count) VALUES (?, ?, ?, ?)",
+                [key + (count,) for key, count in actual.items()],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
+    if drifted:
+        logger.warning(f"Reconciled fleet aggregates: {drifted} groups corrected.")
+    return drifted
+
+def pool_counts(conn):
+    """
+    Args:
+        conn: DBAPI connection to the database.
+    Returns:
+        dict: Pool name to number of registered clients ("" for clients without a pool).
+    """
+    return dict(conn.execute("SELECT pool, SUM(count) FROM client_counts GROUP BY pool").fetchall())
+
+def fleet_aggregates(conn, pools=()):
+    """
+    Summarize the fleet from the counters, without scanning client_data.
+    Args:
+        conn: DBAPI connection to the database.
+        pools (list[Pool]): Configured allocation pools, used to report how full each port range is.
+    Returns:
+        dict: Totals per location, per function, per (location, function) and per pool.
+    """
+    by_location, by_function, by_pool, groups = {}, {}, {}, []
+    total = 0
+    for location, function, pool, count in conn.execute(
+        "SELECT location, function, pool, count FROM client_counts"
+    ):
+        total += count
+        by_location[location] = by_location.get(location, 0) + count
+        by_function[function] = by_function.get(function, 0) + count
+        by_pool[pool] = by_pool.get(pool, 0) + count
+        groups.append({"location": location, "function": function, "pool": pool or None, "count": count})
+
+    pool_fill = []
+    for pool in pools:
+        used = by_pool.get(pool.name, 0)
+        pool_fill.append(dict(pool.to_dict(), used=used, fill=round(used / pool.capacity, 4)))
+
+    return {
+        "total": total,
+        "by_location": by_location,
+        "by_function": by_function,
+        "groups": groups,
+        "pools": pool_fill,
+        "unpooled": by_pool.get("", 0),
+    }
@@ -2,12 +2,24 @@ import os
 import json
 import uuid
 import pyotp
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from typing import Optional
+from fastapi import FastAPI, HTTPException, File, UploadFile, Query, Header, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, validator
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, ClientData  # Assuming these are pre-configured
+from app.database import SessionLocal, ClientData, engine  # Assuming these are pre-configured
+from app.search import search_clients, SEARCH_LIMIT_MAX
+from app.authorized_keys import parse_public_key, fingerprint
+from app.prober import TunnelProber, database_tunnels
+from app.pools import load_pools, select_pool, AUTO_PREFIX
+from app.aggregates import fleet_aggregates, pool_counts, reconcile_counts
+from app.receipts import issue_receipt, verify_receipt, ReceiptError, RECEIPT_RENEW_GRACE
+from app.change_feed import ChangeFeed, install_session_hooks
+from app.registry_snapshot import publish_snapshot
 from loguru import logger
 import time
+import asyncio
 
 app = FastAPI()
 
@@ -17,6 +29,93 @@ if not SHARED_SECRET:
     logger.critical("TOTP_SECRET environment variable not set. Terminating program.")
     raise SystemExit("TOTP_SECRET environment variable is required but not set. Exiting application.")
 
+# Allocation pools (IPv6 prefix + port range + tunnel host) registrations are spread over
+try:
+    POOLS = load_pools()
+except ValueError as e:
+    logger.critical(f"Invalid allocation pool configuration: {e}. Terminating program.")
+    raise SystemExit(f"Invalid allocation pool configuration: {e}")
+
+def pool_usage(session):
+    """Return the number of allocated ports per pool, read from the fleet aggregate counters."""
+    return pool_counts(session.connection().connection)
+
+# Seconds between reconciliations of the fleet aggregate counters against client_data
+AGGREGATES_RECONCILE_INTERVAL = int(os.getenv("AGGREGATES_RECONCILE_INTERVAL", "3600"))
+
+def reconcile_aggregates():
+    conn = engine.raw_connection()
+    try:
+        reconcile_counts(conn, POOLS)
+    finally:
+        conn.close()
+
+async def reconcile_aggregates_forever():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(AGGREGATES_RECONCILE_INTERVAL)
+        try:
+            await loop.run_in_executor(None, reconcile_aggregates)
+        except Exception as e:
+            logger.error(f"Fleet aggregates reconciliation failed: {e}")
+
+# Feed of committed ClientData inserts, updates and deletes for registry consumers
+registry_feed = ChangeFeed()
+install_session_hooks(registry_feed, SessionLocal, ClientData)
+
+# Seconds between checks for registry changes to publish as a new lookup snapshot
+REGISTRY_SNAPSHOT_INTERVAL = int(os.getenv("REGISTRY_SNAPSHOT_INTERVAL", "30"))
+
+# Seconds after which a snapshot is rebuilt even without feed events (catches writes made outside the API)
+REGISTRY_SNAPSHOT_MAX_AGE = int(os.getenv("REGISTRY_SNAPSHOT_MAX_AGE", "900"))
+
+def publish_registry_snapshot():
+    conn = engine.raw_connection()
+    try:
+        publish_snapshot(conn)
+    finally:
+        conn.close()
+
+async def publish_registry_snapshots_forever():
+    loop = asyncio.get_running_loop()
+    published_seq, published_at = None, 0.0
+    while True:
+        seq = registry_feed.last_seq
+        if seq != published_seq or time.monotonic() - published_at >= REGISTRY_SNAPSHOT_MAX_AGE:
+            try:
+                await loop.run_in_executor(None, publish_registry_snapshot)
+                published_seq, published_at = seq, time.monotonic()
+            except Exception as e:
+                logger.error(f"Publishing the registry snapshot failed: {e}")
+        await asyncio.sleep(REGISTRY_SNAPSHOT_INTERVAL)
+
+# Background prober keeping the tunnel reachability cache fresh
+tunnel_prober = TunnelProber(database_tunnels)
+
+@app.on_event("startup")
+async def start_tunnel_prober():
+    app.state.tunnel_prober_task = asyncio.create_task(tunnel_prober.run_forever())
+    logger.info("Tunnel prober started.")
+
+@app.on_event("startup")
+async def start_aggregates_reconciliation():
+    # Assign pre-pool clients to their pool before the first allocation relies on pool usage
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, reconcile_aggregates)
+    except Exception as e:
+        logger.error(f"Fleet aggregates reconciliation failed: {e}")
+    app.state.aggregates_task = asyncio.create_task(reconcile_aggregates_forever())
+
+@app.on_event("startup")
+async def start_registry_snapshots():
+    app.state.registry_snapshot_task = asyncio.create_task(publish_registry_snapshots_forever())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.tunnel_prober_task.cancel()
+    app.state.aggregates_task.cancel()
+    app.state.registry_snapshot_task.cancel()
+
 class TOTPRequest(BaseModel):
     code: str
 
@@ -26,6 +125,9 @@ class TOTPRequest(BaseModel):
             raise ValueError("TOTP code must be exactly 6 digits.")
         return value
 
+class HeartbeatRequest(BaseModel):
+    unique_id: str
+
 @app.post("/verify-totp")
 async def verify_totp(request: TOTPRequest):
     """Verify a submitted TOTP code against the shared secret."""
@@ -46,32 +148,47 @@ async def process_form_data(file: UploadFile = File(...)):
     logger.debug(f"Received file content: {file_content.decode('utf-8')}" )
     data = json.loads(file_content.decode('utf-8'))  # Parse the uploaded JSON data.
 
-    # Retrieve necessary environment variables for processing
-    env_prefix = os.getenv("IPV6_PREFIX", "default_prefix").lower()
-    port_range_start = int(os.getenv("PORT_RANGE_START", "8000"))
-    port_range_end = int(os.getenv("PORT_RANGE_END", "9000"))
-
     # Extract values from the uploaded file
     device_name = data.get("device_name")
-    ipv6_prefix = data.get("ipv6_prefix").lower()
+    ipv6_prefix = (data.get("ipv6_prefix") or AUTO_PREFIX).lower()
     location = data.get("location")
     function = data.get("function")
+    ssh_public_key = data.get("ssh_public_key")
 
-    # Validate that the IPv6 prefix matches the environment prefix
-    if ipv6_prefix != env_prefix:
-        logger.error(f"Invalid IPv6 prefix provided: {ipv6_prefix}. Expected: {env_prefix}.")
-        return {"error": "Invalid IPv6 prefix. Process terminated."}
+    # Validate the client's tunnel key; the comment is dropped and the key is stored in canonical form
+    key_fingerprint = None
+    if ssh_public_key:
+        try:
+            key_type, key_b64 = parse_public_key(ssh_public_key)
+        except ValueError as e:
+            logger.error(f"Invalid SSH public key provided: {e}")
+            return {"error": f"Invalid SSH public key: {e}"}
+        ssh_public_key = f"{key_type} {key_b64}"
+        key_fingerprint = fingerprint(key_b64)
 
     session = SessionLocal()
 
     try:
-        # Generate a new port within the defined range
-        last_port_entry = session.query(ClientData).order_by(ClientData.port.desc()).first()
-        if last_port_entry and last_port_entry.port >= port_range_end:
-            logger.error("No available ports in the defined range.")
+        if key_fingerprint and session.query(ClientData.id).filter_by(ssh_key_fingerprint=key_fingerprint).first():
+            logger.error(f"SSH public key already registered: {key_fingerprint}")
+            return {"error": "SSH public key is already registered."}
+
+        # Place the client in the pool serving the requested prefix, or the least-loaded pool for "auto"
+        pool, error = select_pool(POOLS, ipv6_prefix, pool_usage(session))
+        if pool is None:
+            logger.error(f"No allocation pool for IPv6 prefix {ipv6_prefix}: {error}")
+            return {"error": error}
+        logger.debug(f"Selected allocation pool: {pool.name}")
+
+        # Generate a new port within the pool's range
+        last_port = session.query(func.max(ClientData.port)).filter(
+            ClientData.port > pool.port_start, ClientData.port <= pool.port_end
+        ).scalar()
+        if last_port and last_port >= pool.port_end:
+            logger.error(f"No available ports in the range of pool {pool.name}.")
             return {"error": "No available ports in the defined range."}
 
-        port = last_port_entry.port + 1 if last_port_entry else port_range_start + 1
+        port = last_port + 1 if last_port else pool.port_start + 1
 
         logger.debug(f"Selected unique port: {port}")  
 
@@ -80,7 +197,7 @@ async def process_form_data(file: UploadFile = File(...)):
         hex_timestamp = hex(timestamp)[2:]  # Convert to hexadecimal and remove '0x'
         padded_hex_timestamp = hex_timestamp.zfill(20)  # Pad to 80 bits (20 hex characters)
 
-        ipv6_generated = f"{ipv6_prefix}:{padded_hex_timestamp[:4]}:{padded_hex_timestamp[4:8]}:{padded_hex_timestamp[8:12]}:{padded_hex_timestamp[12:16]}:{padded_hex_timestamp[16:]}"
+        ipv6_generated = pool.address_for(padded_hex_timestamp)
 
         logger.debug(f"Generated IPv6 address: {ipv6_generated}")
 
@@ -95,22 +212,34 @@ async def process_form_data(file: UploadFile = File(...)):
             port=port,
             location=location,
             function=function,
-            unique_id=unique_id
+            unique_id=unique_id,
+            pool=pool.name,
+            ssh_public_key=ssh_public_key,
+            ssh_key_fingerprint=key_fingerprint
         )
         session.add(new_client)
         session.commit()
         logger.info(f"Client data saved successfully: {unique_id}")
 
+        # Signed lease receipt the agent presents on later calls instead of a database lookup
+        receipt, receipt_expires = issue_receipt(unique_id, port, ipv6_generated)
+
         # Return processed data to the client
         return {
             "message": "Data processed successfully",
+            "receipt": receipt,
+            "receipt_expires": receipt_expires,
             "data": {
                 "device_name": device_name,
                 "ipv6_address": ipv6_generated,
                 "port": port,
                 "location": location,
                 "function": function,
-                "unique_id": unique_id
+                "unique_id": unique_id,
+                "pool": pool.name,
+                "tunnel_host": pool.tunnel_host,
+                "listen_host": pool.listen_host,
+                "ssh_key_fingerprint": key_fingerprint
             }
         }
     except Exception as e:
@@ -126,4 +255,106 @@ async def process_form_data(file: UploadFile = File(...)):
         if session.is_active:
             session.close()
         logger.debug("Database session closed.")  # Log session closure
-        logger.debug(f"Selected unique port: {port}")  
+
+@app.post("/heartbeat")
+async def heartbeat(request: HeartbeatRequest, x_drta_receipt: Optional[str] = Header(None)):
+    """Confirm that a registered agent is still known to the server."""
+    # Agents presenting their lease receipt are verified without a database lookup; older agents fall back to one
+    if x_drta_receipt:
+        try:
+            lease = verify_receipt(x_drta_receipt)
+        except ReceiptError as e:
+            logger.warning(f"Heartbeat with rejected receipt from {request.unique_id}: {e}")
+            raise HTTPException(status_code=401, detail=str(e))
+        if lease["unique_id"] != request.unique_id:
+            raise HTTPException(status_code=401, detail="Receipt does not belong to this client")
+        return {"status": "alive", "port": lease["port"], "ipv6_address": lease["ipv6_address"],
+                "receipt_expires": lease["expires"]}
+
+    session = SessionLocal()
+    try:
+        client = session.query(ClientData.port, ClientData.ipv6_address).filter_by(unique_id=request.unique_id).first()
+    finally:
+        session.close()
+    if client is None:
+        logger.warning(f"Heartbeat from unknown client: {request.unique_id}")
+        raise HTTPException(status_code=404, detail="Unknown client")
+    return {"status": "alive", "port": client.port, "ipv6_address": client.ipv6_address}
+
+@app.post("/renew")
+async def renew_receipt(x_drta_receipt: str = Header(...)):
+    """Issue a fresh lease receipt after confirming the lease still exists in the database."""
+    try:
+        lease = verify_receipt(x_drta_receipt, grace=RECEIPT_RENEW_GRACE)
+    except ReceiptError as e:
+        logger.warning(f"Renewal with rejected receipt: {e}")
+        raise HTTPException(status_code=401, detail=str(e))
+
+    session = SessionLocal()
+    try:
+        client = session.query(ClientData.port, ClientData.ipv6_address).filter_by(unique_id=lease["unique_id"]).first()
+    finally:
+        session.close()
+    if client is None or client.port != lease["port"] or client.ipv6_address != lease["ipv6_address"]:
+        logger.warning(f"Renewal for a lease that no longer exists: {lease['unique_id']}")
+        raise HTTPException(status_code=404, detail="Lease no longer exists")
+
+    receipt, receipt_expires = issue_receipt(lease["unique_id"], client.port, client.ipv6_address)
+    logger.info(f"Lease receipt renewed: {lease['unique_id']}")
+    return {"receipt": receipt, "receipt_expires": receipt_expires}
+
+@app.get("/clients/search")
+async def search_fleet(
+    q: Optional[str] = None,
+    device_name: Optional[str] = None,
+    location: Optional[str] = None,
+    function: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=SEARCH_LIMIT_MAX),
+):
+    """Search registered clients by device name, location and function using the fleet search index."""
+    logger.info(f"Fleet search: q={q!r}, device_name={device_name!r}, location={location!r}, function={function!r}")
+    if not any((q, device_name, location, function)):
+        raise HTTPException(status_code=400, detail="At least one search term is required")
+
+    conn = engine.raw_connection()
+    try:
+        results = search_clients(conn, q, limit, device_name=device_name, location=location, function=function)
+    finally:
+        conn.close()
+    return {"count": len(results), "results": results}
+
+@app.get("/tunnels/reachability")
+async def tunnel_reachability(reachable: Optional[bool] = None):
+    """Return the cached reachability of allocated tunnels, optionally filtered by state."""
+    return {"summary": tunnel_prober.cache.summary(), "tunnels": tunnel_prober.cache.entries(reachable)}
+
+@app.get("/tunnels/reachability/{unique_id}")
+async def tunnel_reachability_by_id(unique_id: str):
+    """Return the cached reachability of a single tunnel."""
+    entry = tunnel_prober.cache.get(unique_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown tunnel")
+    return dict(entry)
+
+@app.get("/fleet/aggregates")
+async def fleet_aggregates_summary():
+    """Return device counts per location, function and pool, and how full each pool's port range is."""
+    conn = engine.raw_connection()
+    try:
+        return fleet_aggregates(conn, POOLS)
+    finally:
+        conn.close()
+
+@app.get("/registry/events")
+async def registry_events(request: Request, since: Optional[str] = None,
+                          last_event_id: Optional[str] = Header(None)):
+    """Stream registry changes as Server-Sent Events, resuming after Last-Event-ID (or `since`) when given."""
+    position = registry_feed.parse_position(last_event_id or since)
+
+    async def stream():
+        async for item in registry_feed.subscribe(position):
+            if await request.is_disconnected():
+                break
+            yield registry_feed.format_sse(item)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,263 @@
+import os
+import sys
+import base64
+import socket
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+import binascii
+
+from pools import PERMITLISTEN_HOST
+
+logger = logging.getLogger("AuthorizedKeysLogger")
+
+# Unix socket served by the key daemon and queried by sshd's AuthorizedKeysCommand
+AUTHKEYS_SOCKET = os.getenv("AUTHKEYS_SOCKET", "/run/drta/authkeys.sock")
+
+# Seconds between full reloads of the key index from the database
+AUTHKEYS_REFRESH = int(os.getenv("AUTHKEYS_REFRESH", "60"))
+
+# Timeout in seconds for a lookup against the daemon
+LOOKUP_TIMEOUT = 2.0
+
+ALLOWED_KEY_TYPES = ("ssh-ed25519",)
+
+def parse_public_key(line):
+    """
+    Parse and validate an OpenSSH public key line ("<type> <base64> [comment]").
+    Args:
+        line (str): Public key as found in a .pub file.
+    Returns:
+        tuple: (key_type, key_base64) of the validated key.
+    Raises:
+        ValueError: If the key is malformed or of an unsupported type.
+    """
+    parts = (line or "").strip().split()
+    if len(parts) < 2:
+        raise ValueError("Public key must be in '<type> <base64> [comment]' format.")
+    key_type, key_b64 = parts[0], parts[1]
+    if key_type not in ALLOWED_KEY_TYPES:
+        raise ValueError(f"Unsupported key type: {key_type}. Allowed: {', '.join(ALLOWED_KEY_TYPES)}.")
+    try:
+        blob = base64.b64decode(key_b64, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Public key is not valid base64.")
+
+    # The key blob starts with the length-prefixed key type, which must match the declared type
+    if len(blob) < 4:
+        raise ValueError("Public key blob is truncated.")
+    (type_length,) = struct.unpack(">I", blob[:4])
+    if blob[4:4 + type_length].decode("ascii", "replace") != key_type:
+        raise ValueError("Public key blob does not match its declared type.")
+    return key_type, key_b64
+
+def fingerprint(key_b64):
+    """
+    Compute the OpenSSH SHA256 fingerprint of a public key, as sshd passes it in %f.
+    Args:
+        key_b64 (str): Base64 encoded key blob.
+    Returns:
+        str: Fingerprint in "SHA256:<base64>" form.
+    """
+    digest = hashlib.sha256(base64.b64decode(key_b64)).digest()
+    return "SHA256:" + base64.b64encode(digest).decode("ascii").rstrip("=")
+
+def authorized_keys_line(key_type, key_b64, port, listen_host=PERMITLISTEN_HOST):
+    """
+    Build the authorized_keys line that restricts a client to its allocated tunnel port.
+    Args:
+        key_type (str): SSH key type.
+        key_b64 (str): Base64 encoded key blob.
+        port (int): Port allocated to the client.
+        listen_host (str): Address the client may bind the tunnel on (the listen_host of its pool).
+    Returns:
+        str: authorized_keys line with restrict and permitlisten options.
+    """
+    return f'restrict,port-forwarding,permitlisten="{listen_host}:{port}" {key_type} {key_b64}'
+
+class KeyIndex:
+    """
+    In-memory index of registered client keys keyed by fingerprint.
+    Lookups are a single dict access; misses fall back to one indexed database query,
+    so keys registered since the last reload are found without waiting for it.
+    """
+
+    def __init__(self, load_all, load_one, listen_host_for=lambda port: PERMITLISTEN_HOST):
+        """
+        Args:
+            load_all (callable): Returns (fingerprint, key, port) tuples for every registered key.
+            load_one (callable): Returns (key, port) for a fingerprint, or None if unknown.
+            listen_host_for (callable): Returns the permitlisten address for a port.
+        """
+        self._load_all = load_all
+        self._load_one = load_one
+        self._listen_host_for = listen_host_for
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reload(self):
+        """Replace the index with the current contents of the database."""
+        entries = {}
+        for key_fingerprint, public_key, port in self._load_all():
+            key_type, key_b64 = public_key.split()[:2]
+            entries[key_fingerprint] = authorized_keys_line(key_type, key_b64, port, self._listen_host_for(port))
+        self._entries = entries  # Swap in one step so concurrent lookups never see a partial index
+        logger.info(f"Loaded {len(entries)} client keys.")
+
+    def cached(self, key_fingerprint):
+        """Return the cached authorized_keys line for a fingerprint without touching the database."""
+        return self._entries.get(key_fingerprint)
+
+    def lookup(self, key_fingerprint):
+        """
+        Args:
+            key_fingerprint (str): Fingerprint in "SHA256:<base64>" form.
+        Returns:
+            str: authorized_keys line for the key, or None if it is not registered.
+        """
+        line = self._entries.get(key_fingerprint)
+        if line is None:
+            row = self._load_one(key_fingerprint)
+            if row:
+                key_type, key_b64 = row[0].split()[:2]
+                line = authorized_keys_line(key_type, key_b64, row[1], self._listen_host_for(row[1]))
+                self._entries[key_fingerprint] = line
+        return line
+
+def database_key_index():
+    """
+    Create a KeyIndex backed by the client registry database.
+    Returns:
+        KeyIndex: Index loading keys from client_data.
+    """
+    from database import SessionLocal, ClientData
+    from pools import load_pools, pool_for_port
+
+    pools = load_pools()
+
+    def listen_host_for(port):
+        pool = pool_for_port(pools, port)
+        return pool.listen_host if pool else PERMITLISTEN_HOST
+
+    def load_all():
+        session = SessionLocal()
+        try:
+            return session.query(
+                ClientData.ssh_key_fingerprint, ClientData.ssh_public_key, ClientData.port
+            ).filter(ClientData.ssh_key_fingerprint.isnot(None)).all()
+        finally:
+            session.close()
+
+    def load_one(key_fingerprint):
+        session = SessionLocal()
+        try:
+            return session.query(ClientData.ssh_public_key, ClientData.port).filter_by(
+                ssh_key_fingerprint=key_fingerprint
+            ).first()
+        finally:
+            session.close()
+
+    return KeyIndex(load_all, load_one, listen_host_for)
+
+async def serve(index, socket_path=AUTHKEYS_SOCKET, refresh=AUTHKEYS_REFRESH):
+    """
+    Serve fingerprint lookups on a Unix socket: one fingerprint per line in,
+    one authorized_keys line (empty if unknown) out.
+    Args:
+        index (KeyIndex): Key index to answer from.
+        socket_path (str): Path of the Unix socket.
+        refresh (int): Seconds between full reloads of the index.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                key_fingerprint = request.decode("ascii", "replace").strip()
+                line = index.cached(key_fingerprint)
+                if line is None:
+                    line = await loop.run_in_executor(None, index.lookup, key_fingerprint)
+                writer.write(((line or "") + "\n").encode("ascii"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def refresh_loop():
+        while True:
+            await asyncio.sleep(refresh)
+            try:
+                await loop.run_in_executor(None, index.reload)
+            except Exception as e:
+                logger.error(f"Failed to reload client keys: {e}")
+
+    await loop.run_in_executor(None, index.reload)
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    os.chmod(socket_path, 0o666)  # sshd runs the command as AuthorizedKeysCommandUser
+    logger.info(f"Serving client keys on {socket_path}.")
+    refresher = asyncio.create_task(refresh_loop())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+
+def lookup(key_fingerprint, socket_path=AUTHKEYS_SOCKET):
+    """
+    Query the key daemon for a fingerprint.
+    Args:
+        key_fingerprint (str): Fingerprint in "SHA256:<base64>" form.
+        socket_path (str): Path of the daemon's Unix socket.
+    Returns:
+        str: authorized_keys line, or None if the key is not registered.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(LOOKUP_TIMEOUT)
+        sock.connect(socket_path)
+        sock.sendall((key_fingerprint + "\n").encode("ascii"))
+        response = b""
+        while not response.endswith(b"\n"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+    return response.decode("ascii").strip() or None
+
+def main():
+    """
+    Command line entry point.
+    `serve` runs the key daemon; `lookup %f` is meant to be used as sshd's AuthorizedKeysCommand.
+    """
+    parser = argparse.ArgumentParser(description="Indexed AuthorizedKeysCommand backend for DRTA tunnels.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("serve", help="Run the key daemon.")
+    lookup_parser = subparsers.add_parser("lookup", help="Print the authorized_keys line for a key fingerprint.")
+    lookup_parser.add_argument("fingerprint", help="Key fingerprint (sshd token %%f).")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(serve(database_key_index()))
+        return
+
+    try:
+        line = lookup(args.fingerprint)
+    except OSError as e:
+        print(f"[ERROR] Key daemon unavailable: {e}", file=sys.stderr)
+        sys.exit(1)
+    if line:
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import sys
+import gzip
+import json
+import zlib
+import time
+import hashlib
+import logging
+import argparse
+
+from search import fts_exists
+from aggregates import counts_exist, RECOUNT_QUERY
+
+logger = logging.getLogger("BackupLogger")
+
+# Format identifier written into the header line of every export
+EXPORT_FORMAT = "drta-client-data"
+EXPORT_VERSION = 2
+
+# Version 1 exports are still readable; their checksum does not cover the header line
+READABLE_VERSIONS = (1, 2)
+
+# Number of rows fetched from / written to the database per batch (one NDJSON line per chunk)
+CHUNK_SIZE = 10000
+
+# gzip level for exports; low levels keep compression from dominating the export time
+COMPRESS_LEVEL = 3
+
+def _table_columns(conn):
+    return [row[1] for row in conn.execute("PRAGMA table_info(client_data)")]
+
+def export_clients(conn, path, chunk_size=CHUNK_SIZE):
+    """
+    Stream client_data to a gzip compressed, chunked NDJSON file.
+    The first line is a header with the column list, every following line is one chunk
+    of rows encoded as a JSON array of arrays and the last line is a trailer with the
+    row count and the SHA-256 checksum of the header and all chunk lines. Chunks are read inside a single
+    read transaction, so the export is a consistent snapshot and memory use stays constant.
+    With the database in WAL mode the export does not block registrations.
+    Args:
+        conn: DBAPI connection to the database.
+        path (str): Output file path.
+        chunk_size (int): Rows fetched per batch.
+    Returns:
+        dict: Trailer with the number of rows exported and their checksum.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage the read transaction explicitly
+    digest = hashlib.sha256()
+    rows = 0
+    try:
+        conn.execute("BEGIN")
+        columns = _table_columns(conn)
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM client_data ORDER BY id")
+        with gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL) as out:
+            header = {"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "columns": columns,
+                      "created": int(time.time())}
+            header_line = (json.dumps(header) + "\n").encode("utf-8")
+            digest.update(header_line)  # The column list decides where every value is loaded
+            out.write(header_line)
+            while True:
+                batch = cursor.fetchmany(chunk_size)
+                if not batch:
+                    break
+                chunk = (json.dumps(batch, separators=(",", ":")) + "\n").encode("utf-8")
+                digest.update(chunk)
+                out.write(chunk)
+                rows += len(batch)
+            trailer = {"rows": rows, "sha256": digest.hexdigest()}
+            out.write((json.dumps(trailer) + "\n").encode("utf-8"))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:  # BEGIN itself may have failed
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
+    logger.info(f"Exported {rows} clients to {path}.")
+    return trailer
+
+def _read_export(path, digest):
+    """Yield the header, each chunk of rows and finally the trailer of an export, updating the checksum."""
+    with gzip.open(path, "rb") as src:
+        header_line = src.readline()
+        header = json.loads(header_line)
+        if header.get("format") != EXPORT_FORMAT or header.get("version") not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported export format in {path}: {header.get('format')} v{header.get('version')}")
+        if header["version"] >= 2:
+            digest.update(header_line)
+        yield header
+        for line in src:
+            if line.startswith(b"{"):
+                yield json.loads(line)  # Trailer
+                return
+            digest.update(line)
+            yield json.loads(line)
+    raise ValueError(f"Export {path} is truncated: trailer line is missing.")
+
+def import_clients(conn, path, replace=False):
+    """
+    Bulk-load an export produced by export_clients into client_data.
+    Secondary indexes and the triggers maintaining the fleet search index and aggregates
+    are dropped for the duration of the load; indexes are rebuilt and the search index
+    and aggregates recomputed once at the end. Everything runs in one transaction, which
+    is rolled back if the row count or checksum does not match the trailer.
+    Args:
+        conn: DBAPI connection to the database.
+        path (str): Export file path.
+        replace (bool): Delete existing clients before loading. Without it the table must be empty.
+    Returns:
+        int: Number of rows imported.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage the write transaction explicitly
+    digest = hashlib.sha256()
+    rows = 0
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if not replace and conn.execute("SELECT EXISTS (SELECT 1 FROM client_data)").fetchone()[0]:
+            raise ValueError("client_data is not empty. Use --replace to overwrite existing clients.")
+
+        # Defer index maintenance: drop explicit indexes and triggers, recreate them after the load
+        deferred = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+            "AND tbl_name='client_data' AND sql IS NOT NULL"
+        ).fetchall()
+        for object_type, name, _ in deferred:
+            conn.execute(f'DROP {object_type.upper()} "{name}"')
+        if replace:
+            conn.execute("DELETE FROM client_data")
+
+        reader = _read_export(path, digest)
+        header = next(reader)
+        table_columns = set(_table_columns(conn))
+        columns = [column for column in header["columns"] if column in table_columns]
+        positions = [header["columns"].index(column) for column in columns]
+        remap = positions != list(range(len(header["columns"])))
+        insert_sql = (f"INSERT INTO client_data ({', '.join(columns)}) "
+                      f"VALUES ({', '.join('?' for _ in columns)})")
+
+        for record in reader:
+            if isinstance(record, dict):
+                trailer = record
+                break
+            if remap:
+                record = [[row[i] for i in positions] for row in record]
+            conn.executemany(insert_sql, record)
+            rows += len(record)
+
+        if trailer["rows"] != rows or trailer["sha256"] != digest.hexdigest():
+            raise ValueError(f"Checksum mismatch in {path}: expected {trailer['rows']} rows "
+                             f"({trailer['sha256']}), read {rows} rows ({digest.hexdigest()}).")
+
+        for _, _, sql in deferred:
+            conn.execute(sql)
+        if fts_exists(conn):
+            conn.execute("INSERT INTO client_data_fts(client_data_fts) VALUES ('rebuild')")
+        if counts_exist(conn):
+            conn.execute("DELETE FROM client_counts")
+            conn.execute(f"INSERT INTO client_counts(location, function, pool, count) {RECOUNT_QUERY}")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:  # BEGIN IMMEDIATE itself may have failed (database locked)
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
+    logger.info(f"Imported {rows} clients from {path}.")
+    return rows
+
+def main():
+    """
+    Command line entry point: export or import the client registry.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export or import the DRTA client registry.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Stream client_data to a compressed NDJSON file.")
+    export_parser.add_argument("path", help="Output file, e.g. clients.ndjson.gz")
+    import_parser = subparsers.add_parser("import", help="Bulk-load client_data from an export file.")
+    import_parser.add_argument("path", help="Export file to load.")
+    import_parser.add_argument("--replace", action="store_true", help="Delete existing clients before loading.")
+    args = parser.parse_args()
+
+    # Imported here so that the database is only opened when the command actually runs
+    from database import connect, DB_PATH, DB_KEY
+
+    conn = connect(DB_PATH, DB_KEY)
+    try:
+        start = time.perf_counter()
+        if args.command == "export":
+            trailer = export_clients(conn, args.path)
+            print(f"Exported {trailer['rows']} rows, sha256 {trailer['sha256']}")
+        else:
+            rows = import_clients(conn, args.path, replace=args.replace)
+            print(f"Imported {rows} rows")
+        print(f"Finished in {time.perf_counter() - start:.2f} s")
+    except (ValueError, EOFError, OSError, zlib.error) as e:
+        # Corrupt or truncated gzip data surfaces as EOFError, BadGzipFile (an OSError) or zlib.error
+        logger.error(f"{args.command.capitalize()} of {args.path} failed: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
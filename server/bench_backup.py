@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+from search import install_fts
+from backup import export_clients, import_clients
+from bench_search import populate
+
+# Benchmark for registry export/import round trips.
+# Usage: python bench_backup.py [rows]
+
+def open_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = open_db(os.path.join(tmp, "source.db"))
+        populate(source, rows)
+        source.execute("CREATE INDEX ix_client_data_id ON client_data (id)")
+        install_fts(source)
+
+        export_path = os.path.join(tmp, "clients.ndjson.gz")
+        start = time.perf_counter()
+        trailer = export_clients(source, export_path)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(export_path) / 1024 / 1024
+        print(f"Export: {trailer['rows']} rows in {elapsed:.2f} s ({size:.1f} MiB compressed)")
+
+        target = open_db(os.path.join(tmp, "target.db"))
+        target.execute(
+            "CREATE TABLE client_data (id INTEGER PRIMARY KEY, device_name VARCHAR NOT NULL, "
+            "ipv6_address VARCHAR NOT NULL UNIQUE, port INTEGER NOT NULL UNIQUE, location VARCHAR NOT NULL, "
+            "function VARCHAR NOT NULL, unique_id VARCHAR NOT NULL UNIQUE)"
+        )
+        target.execute("CREATE INDEX ix_client_data_id ON client_data (id)")
+        install_fts(target)
+
+        start = time.perf_counter()
+        imported = import_clients(target, export_path)
+        print(f"Import: {imported} rows in {time.perf_counter() - start:.2f} s (indexes and FTS rebuilt)")
+
+if __name__ == "__main__":
+    main()
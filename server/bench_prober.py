@@ -0,0 +1,38 @@
+import sys
+import time
+import asyncio
+
+from prober import TunnelProber
+
+# Benchmark for a full tunnel reachability sweep against localhost.
+# A share of the ports gets a listener (live tunnel), the rest refuse the connection.
+# Usage: python bench_prober.py [tunnels] [listeners] [concurrency]
+
+BASE_PORT = 20000
+
+async def main():
+    tunnels = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    listeners = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    async def accept(reader, writer):
+        writer.close()
+
+    servers = [await asyncio.start_server(accept, "127.0.0.1", BASE_PORT + i) for i in range(listeners)]
+    targets = [(f"{i:020x}", f"fd:fc:fb:fa::{i:x}", "127.0.0.1", BASE_PORT + i) for i in range(tunnels)]
+    prober = TunnelProber(lambda: targets, concurrency=concurrency, timeout=1.0, batch=tunnels)
+
+    await prober.refresh_targets()
+    start = time.perf_counter()
+    probed = await prober.run_round()
+    elapsed = time.perf_counter() - start
+    summary = prober.cache.summary()
+    print(f"Swept {probed} tunnels in {elapsed:.2f} s with concurrency {concurrency}: "
+          f"{summary['reachable']} reachable, {summary['unreachable']} unreachable")
+    print(f"Second round (nothing stale yet) probed {await prober.run_round()} tunnels")
+
+    for server in servers:
+        server.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+import re
+import sys
+import time
+import random
+import sqlite3
+
+from search import regexp, install_fts, search_clients
+
+# Benchmark for fleet search: legacy per-row REGEXP callback vs. cached REGEXP vs. FTS5 index.
+# Usage: python bench_search.py [rows]
+
+LOCATIONS = ["bratislava", "kosice", "zilina", "nitra", "presov", "trnava", "martin", "poprad"]
+FUNCTIONS = ["gateway", "sensor", "camera", "router", "plc", "meter", "display", "kiosk"]
+
+def populate(conn, rows):
+    conn.execute(
+        "CREATE TABLE client_data (id INTEGER PRIMARY KEY, device_name VARCHAR NOT NULL, "
+        "ipv6_address VARCHAR NOT NULL UNIQUE, port INTEGER NOT NULL UNIQUE, location VARCHAR NOT NULL, "
+        "function VARCHAR NOT NULL, unique_id VARCHAR NOT NULL UNIQUE)"
+    )
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO client_data VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"{rng.choice(FUNCTIONS)}-{i:06d}", f"fd:fc:fb:fa::{i:x}", 10000 + i,
+             f"{rng.choice(LOCATIONS)}-site{rng.randrange(50)}", rng.choice(FUNCTIONS), f"{i:020x}")
+            for i in range(1, rows + 1)
+        ),
+    )
+    conn.commit()
+
+def timed(label, func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:10.2f} ms  ({len(result)} rows)")
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    legacy = sqlite3.connect(":memory:")
+    legacy.create_function("regexp", 2, lambda x, y: bool(re.search(x, y)))
+    populate(legacy, rows)
+
+    cached = sqlite3.connect(":memory:")
+    cached.create_function("regexp", 2, regexp)
+    populate(cached, rows)
+
+    start = time.perf_counter()
+    install_fts(cached)
+    print(f"Built FTS index over {rows} rows in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    sql = "SELECT * FROM client_data WHERE location REGEXP ? AND function REGEXP ?"
+    params = ("^kosice-site1", "^camera$")
+    timed("REGEXP, uncompiled lambda (before)", lambda: legacy.execute(sql, params).fetchall())
+    timed("REGEXP, cached compiled pattern", lambda: cached.execute(sql, params).fetchall())
+    timed("FTS5 search_clients (limit 500)",
+          lambda: search_clients(cached, limit=500, location="kosice-site1", function="camera"))
+    timed("FTS5 search_clients, free text",
+          lambda: search_clients(cached, "camera-0004", limit=500))
+
+if __name__ == "__main__":
+    main()
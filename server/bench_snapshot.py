@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+from bench_search import populate
+from registry_snapshot import publish_snapshot, SnapshotReader
+
+# Benchmark for registry snapshots: publish time, file size and lookup latency
+# of the memory-mapped snapshot compared to indexed SQLite queries.
+# Usage: python bench_snapshot.py [rows] [lookups]
+
+def timed(label, func, keys):
+    start = time.perf_counter()
+    for key in keys:
+        assert func(key) is not None
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed / len(keys) * 1e6:8.2f} us/lookup")
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+
+    conn = sqlite3.connect(":memory:")
+    populate(conn, rows)
+    conn.execute("ALTER TABLE client_data ADD COLUMN pool VARCHAR")
+    conn.execute("UPDATE client_data SET pool = 'node-' || (id % 4), "
+                 "ipv6_address = printf('fd:fc:fb:fa::%x:%x', id >> 16, id & 65535)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        generation = publish_snapshot(conn, directory)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(os.path.join(directory, f"registry-{generation:012d}.snap"))
+        print(f"Published {rows} clients in {elapsed * 1000:.1f} ms, {size / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        unchanged = publish_snapshot(conn, directory)
+        print(f"Unchanged registry check in {(time.perf_counter() - start) * 1000:.1f} ms (new version: {unchanged})")
+
+        reader = SnapshotReader(directory)
+        start = time.perf_counter()
+        reader.refresh()
+        print(f"Mapped and verified snapshot in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        rng = random.Random(7)
+        ids = [rng.randint(1, rows) for _ in range(lookups)]
+        timed("snapshot by port", lambda i: reader.lookup("port", 10000 + i), ids)
+        timed("snapshot by unique_id", lambda i: reader.lookup("unique_id", f"{i:020x}"), ids)
+        timed("snapshot by ipv6", lambda i: reader.lookup("ipv6", f"fd:fc:fb:fa::{i >> 16:x}:{i & 0xffff:x}"), ids)
+        timed("sqlite by port", lambda i: conn.execute(
+            "SELECT * FROM client_data WHERE port = ?", (10000 + i,)).fetchone(), ids)
+        timed("sqlite by unique_id", lambda i: conn.execute(
+            "SELECT * FROM client_data WHERE unique_id = ?", (f"{i:020x}",)).fetchone(), ids)
+
+if __name__ == "__main__":
+    main()
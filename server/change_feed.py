@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from sqlalchemy import event, inspect
+
+logger = logging.getLogger("ChangeFeedLogger")
+
+# Number of events kept in memory for consumers resuming from an earlier sequence number
+CHANGE_FEED_BUFFER = int(os.getenv("CHANGE_FEED_BUFFER", "10000"))
+
+# Seconds between keepalive comments on idle event streams
+CHANGE_FEED_KEEPALIVE = float(os.getenv("CHANGE_FEED_KEEPALIVE", "15"))
+
+class ChangeFeed:
+    """
+    In-process feed of registry changes with monotonically increasing sequence numbers.
+
+    Events are kept in a bounded replay buffer. Every process start opens a new epoch; a consumer
+    resuming from another epoch, or from a sequence that already fell out of the buffer, gets a
+    reset and has to re-list the registry.
+    """
+
+    def __init__(self, maxlen=CHANGE_FEED_BUFFER):
+        self.epoch = str(int(time.time() * 1000))
+        self._seq = 0
+        self._events = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def publish(self, event_type, data):
+        """
+        Append an event and wake up all subscribers. Safe to call from any thread.
+        Args:
+            event_type (str): "insert", "update" or "delete".
+            data (dict): Client row the event is about.
+        Returns:
+            dict: The published event.
+        """
+        with self._lock:
+            self._seq += 1
+            item = {"seq": self._seq, "type": event_type, "ts": time.time(), "data": data}
+            self._events.append(item)
+            waiters = list(self._waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+        return item
+
+    def since(self, seq):
+        """
+        Args:
+            seq (int): Last sequence number the consumer has seen.
+        Returns:
+            tuple: (events, complete); complete is False if events after `seq` were already evicted.
+        """
+        with self._lock:
+            if seq > self._seq:
+                return [], False
+            oldest = self._events[0]["seq"] if self._events else self._seq + 1
+            if seq + 1 < oldest:
+                return list(self._events), False
+            return [item for item in self._events if item["seq"] > seq], True
+
+    def parse_position(self, last_event_id):
+        """
+        Args:
+            last_event_id (str): "<epoch>:<seq>" as sent in SSE ids, or None for a fresh consumer.
+        Returns:
+            int: Sequence number to resume after, or None if the position is unusable in this epoch.
+        """
+        if not last_event_id:
+            return self._seq
+        epoch, _, seq = last_event_id.partition(":")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    async def subscribe(self, seq):
+        """
+        Yield events after `seq` as they are published, starting with the buffered ones.
+        Yields a {"type": "reset"} event when the requested position cannot be resumed,
+        and None after CHANGE_FEED_KEEPALIVE seconds without events.
+        Args:
+            seq (int): Sequence number to resume after, or None to force a reset.
+        """
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            if seq is None:
+                seq = self._seq
+                yield {"seq": seq, "type": "reset", "ts": time.time(), "data": {"reason": "unknown position"}}
+            while True:
+                wakeup.clear()  # Cleared before reading, so a publish in between is never missed
+                events, complete = self.since(seq)
+                if not complete:
+                    seq = events[-1]["seq"] if events else self._seq
+                    yield {"seq": seq, "type": "reset", "ts": time.time(), "data": {"reason": "position expired"}}
+                    continue
+                for item in events:
+                    seq = item["seq"]
+                    yield item
+                if not events:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), CHANGE_FEED_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def format_sse(self, item):
+        """
+        Args:
+            item (dict): Event yielded by subscribe, or None for a keepalive.
+        Returns:
+            str: Server-Sent Events frame.
+        """
+        if item is None:
+            return ": keepalive\n\n"
+        return (f"id: {self.epoch}:{item['seq']}\n"
+                f"event: {item['type']}\n"
+                f"data: {json.dumps(item, separators=(',', ':'))}\n\n")
+
+def _row(instance):
+    return {column.key: getattr(instance, column.key) for column in inspect(instance).mapper.column_attrs
+            if column.key != "ssh_public_key"}
+
+def install_session_hooks(feed, session_factory, model):
+    """
+    Publish an event to the feed for every committed insert, update and delete of `model`.
+    Changes are collected when the session flushes and published only after the commit succeeds.
+    Args:
+        feed (ChangeFeed): Feed to publish to.
+        session_factory (sqlalchemy.orm.sessionmaker): Session factory used by the application.
+        model: Mapped class whose changes are published.
+    """
+
+    @event.listens_for(session_factory, "after_flush")
+    def collect_changes(session, flush_context):
+        pending = session.info.setdefault("change_feed", [])
+        pending.extend(("insert", _row(obj)) for obj in session.new if isinstance(obj, model))
+        pending.extend(("update", _row(obj)) for obj in session.dirty
+                       if isinstance(obj, model) and session.is_modified(obj))
+        pending.extend(("delete", _row(obj)) for obj in session.deleted if isinstance(obj, model))
+
+    @event.listens_for(session_factory, "after_commit")
+    def publish_changes(session):
+        for event_type, data in session.info.pop("change_feed", []):
+            feed.publish(event_type, data)
+
+    @event.listens_for(session_factory, "after_soft_rollback")
+    def discard_changes(session, previous_transaction):
+        session.info.pop("change_feed", None)
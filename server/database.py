@@ -1,9 +1,10 @@
 import os
 import logging
 import sqlite3  # Import SQLite to define the custom connection
-import re
 from sqlalchemy import create_engine, Column, String, Integer
 from sqlalchemy.orm import declarative_base, sessionmaker
+from search import regexp, install_fts
+from aggregates import install_aggregates
 
 # Logging Configuration
 logging.basicConfig(level=logging.INFO)
@@ -22,9 +23,12 @@ def connect(db_path, db_key):
     Returns:
         sqlite3.Connection: The SQLite connection.
     """
-    conn = sqlite3.connect(db_path)  # Pripojenie k SQLite databáze
+    # Pooled connections are handed to executor threads (key daemon, prober, snapshot publisher);
+    # the pool already guarantees one user at a time, and creator= bypasses connect_args
+    conn = sqlite3.connect(db_path, check_same_thread=False)  # Pripojenie k SQLite databáze
     conn.execute(f"PRAGMA key='{db_key}'")  # Nastavenie šifrovacieho kľúča
-    conn.create_function("regexp", 2, lambda x, y: bool(re.search(x, y)))  # Registrácia 'regexp' funkcie
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers (e.g. online export) do not block writers
+    conn.create_function("regexp", 2, regexp)  # Registrácia 'regexp' funkcie
     return conn
 
 # Initialize database connection
@@ -54,6 +58,9 @@ class ClientData(Base):
         location (str): Physical or logical location of the device.
         function (str): Role or functionality of the device.
         unique_id (str): Unique identifier for the client.
+        pool (str): Name of the allocation pool the client's address and port come from.
+        ssh_public_key (str): OpenSSH public key the client uses for its reverse tunnel.
+        ssh_key_fingerprint (str): SHA256 fingerprint of the public key, used for sshd key lookups.
     """
     __tablename__ = "client_data"
 
@@ -64,6 +71,9 @@ class ClientData(Base):
     location = Column(String, nullable=False)
     function = Column(String, nullable=False)
     unique_id = Column(String, unique=True, nullable=False)
+    pool = Column(String, index=True, nullable=True)
+    ssh_public_key = Column(String, nullable=True)
+    ssh_key_fingerprint = Column(String, unique=True, index=True, nullable=True)
 
     def __repr__(self):
         return (
@@ -80,6 +90,41 @@ except Exception as e:
     logger.critical(f"Failed to create database tables: {e}")
     raise
 
+# Add columns introduced after a database was created (create_all only creates missing tables)
+def ensure_columns(table):
+    """
+    Add model columns that are missing from an existing table, together with their indexes.
+    Args:
+        table (sqlalchemy.Table): Table definition to compare against the database.
+    """
+    with engine.begin() as conn:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                logger.info(f"Adding missing column {table.name}.{column.name}...")
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+try:
+    ensure_columns(ClientData.__table__)
+except Exception as e:
+    logger.critical(f"Failed to update database tables: {e}")
+    raise
+
+# Create the fleet search index and the fleet aggregate counters
+try:
+    raw_conn = engine.raw_connection()
+    try:
+        install_fts(raw_conn)
+        install_aggregates(raw_conn)
+    finally:
+        raw_conn.close()
+except Exception as e:
+    logger.critical(f"Failed to create fleet search index or aggregates: {e}")
+    raise
+
 # Utility function for obtaining a database session
 def get_db_session():
     """
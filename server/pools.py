@@ -0,0 +1,180 @@
+import os
+import json
+import logging
+import ipaddress
+
+logger = logging.getLogger("PoolsLogger")
+
+# Prefix value that lets the server choose the least-loaded pool
+AUTO_PREFIX = "auto"
+
+# Address clients may bind their reverse tunnel on (sshd permitlisten), unless a pool sets listen_host
+PERMITLISTEN_HOST = os.getenv("PERMITLISTEN_HOST", "localhost")
+
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+WILDCARD_HOSTS = ("*", "0.0.0.0", "::")
+
+def normalize_prefix(prefix):
+    """
+    Bring an IPv6 prefix into canonical form so that equivalent spellings compare equal.
+    Args:
+        prefix (str): Prefix such as "fd:fc:fb::/48".
+    Returns:
+        str: Canonical network string, or the lower-cased input if it is not a valid network.
+    """
+    prefix = (prefix or "").strip().lower()
+    try:
+        return str(ipaddress.IPv6Network(prefix, strict=False))
+    except ValueError:
+        return prefix
+
+class Pool:
+    """
+    An independent allocation pool: one IPv6 prefix, one port range and the tunnel host serving it.
+    Ports are allocated from port_start + 1 up to and including port_end. Clients bind their
+    tunnel on listen_host of the tunnel host, and the prober connects to probe_host (see
+    default_probe_host when it is not set).
+    """
+
+    def __init__(self, name, prefix, port_start, port_end, tunnel_host, probe_host=None, listen_host=None):
+        self.name = name
+        self.prefix = normalize_prefix(prefix)
+        self.port_start = int(port_start)
+        self.port_end = int(port_end)
+        self.tunnel_host = tunnel_host
+        self.listen_host = listen_host or PERMITLISTEN_HOST
+        self.probe_host = probe_host or self.default_probe_host()
+        if self.port_end <= self.port_start:
+            raise ValueError(f"Pool {name}: port_end must be greater than port_start.")
+        try:
+            self.network = ipaddress.IPv6Network(self.prefix)
+        except ValueError:
+            self.network = None  # Legacy free-form prefix, addresses are built by string concatenation
+            logger.warning(f"Pool {name}: prefix {prefix!r} is not an IPv6 network.")
+
+    def default_probe_host(self):
+        """
+        Returns:
+            str: Address where the pool's tunnels can be reached from this server, or None if
+            they listen on the loopback of a remote tunnel host (set probe_host to probe them).
+        """
+        if self.listen_host in WILDCARD_HOSTS:
+            return self.tunnel_host
+        if self.listen_host not in LOOPBACK_HOSTS:
+            return self.listen_host
+        if self.tunnel_host in LOOPBACK_HOSTS:
+            return os.getenv("PROBE_HOST", "127.0.0.1")
+        return None
+
+    @property
+    def capacity(self):
+        return self.port_end - self.port_start
+
+    def owns_port(self, port):
+        return self.port_start < port <= self.port_end
+
+    def address_for(self, padded_hex):
+        """
+        Build the client IPv6 address from the pool prefix and an 80-bit hex identifier.
+        Args:
+            padded_hex (str): 20 hex characters (the client's unique_id).
+        Returns:
+            str: IPv6 address of the client.
+        """
+        if self.network is None:
+            return (f"{self.prefix}:{padded_hex[:4]}:{padded_hex[4:8]}:{padded_hex[8:12]}"
+                    f":{padded_hex[12:16]}:{padded_hex[16:]}")
+        host_bits = int(padded_hex, 16) & int(self.network.hostmask)
+        return str(ipaddress.IPv6Address(int(self.network.network_address) | host_bits))
+
+    def to_dict(self):
+        return {"name": self.name, "prefix": self.prefix, "port_start": self.port_start,
+                "port_end": self.port_end, "tunnel_host": self.tunnel_host, "listen_host": self.listen_host, "probe_host": self.probe_host,
+                "capacity": self.capacity}
+
+def load_pools():
+    """
+    Load allocation pools from the environment.
+    ALLOCATION_POOLS (JSON list) or ALLOCATION_POOLS_FILE (path to a JSON file) define the pools as
+    objects with name, prefix, port_start, port_end, tunnel_host and optionally listen_host and
+    probe_host. Without either, a single "default" pool is built from IPV6_PREFIX, PORT_RANGE_START,
+    PORT_RANGE_END and TUNNEL_HOST.
+    Returns:
+        list[Pool]: Configured pools.
+    Raises:
+        ValueError: If the configuration is invalid or port ranges overlap.
+    """
+    raw = os.getenv("ALLOCATION_POOLS")
+    pools_file = os.getenv("ALLOCATION_POOLS_FILE")
+    if not raw and pools_file:
+        with open(pools_file, "r") as f:
+            raw = f.read()
+
+    if raw:
+        try:
+            config = json.loads(raw)
+            pools = [Pool(item["name"], item["prefix"], item["port_start"], item["port_end"],
+                          item.get("tunnel_host", os.getenv("TUNNEL_HOST", "localhost")),
+                          item.get("probe_host"), item.get("listen_host"))
+                     for item in config]
+        except (KeyError, TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid allocation pool configuration: {e}")
+    else:
+        pools = [Pool("default",
+                      os.getenv("IPV6_PREFIX", "default_prefix"),
+                      os.getenv("PORT_RANGE_START", "8000"),
+                      os.getenv("PORT_RANGE_END", "9000"),
+                      os.getenv("TUNNEL_HOST", "localhost"))]
+
+    if not pools:
+        raise ValueError("At least one allocation pool must be configured.")
+    if len({pool.name for pool in pools}) != len(pools):
+        raise ValueError("Allocation pool names must be unique.")
+    ordered = sorted(pools, key=lambda pool: pool.port_start)
+    for previous, current in zip(ordered, ordered[1:]):
+        if current.port_start < previous.port_end:
+            raise ValueError(f"Port ranges of pools {previous.name} and {current.name} overlap.")
+    for pool in pools:
+        if pool.probe_host is None:
+            logger.warning(f"Pool {pool.name}: tunnels listen on the loopback of {pool.tunnel_host} and are not "
+                           f"probed. Set probe_host, or a listen_host reachable from this server.")
+    logger.info(f"Loaded {len(pools)} allocation pools: {', '.join(pool.name for pool in pools)}.")
+    return pools
+
+def pool_for_port(pools, port):
+    """
+    Args:
+        pools (list[Pool]): Configured pools.
+        port (int): Allocated port.
+    Returns:
+        Pool: Pool whose port range contains the port, or None.
+    """
+    for pool in pools:
+        if pool.owns_port(port):
+            return pool
+    return None
+
+def select_pool(pools, requested_prefix, usage):
+    """
+    Choose the pool for a new registration.
+    A specific prefix restricts the choice to pools serving that prefix; "auto" or an empty
+    prefix allows every pool. Among the candidates the one with the lowest fill ratio wins.
+    Args:
+        pools (list[Pool]): Configured pools.
+        requested_prefix (str): Prefix requested by the client.
+        usage (dict): Pool name to number of allocated ports.
+    Returns:
+        tuple: (pool, error); pool is None and error explains why if no pool can take the client.
+    """
+    requested = normalize_prefix(requested_prefix)
+    if requested in ("", AUTO_PREFIX):
+        candidates = pools
+    else:
+        candidates = [pool for pool in pools if pool.prefix == requested]
+        if not candidates:
+            return None, "Invalid IPv6 prefix. Process terminated."
+
+    available = [pool for pool in candidates if usage.get(pool.name, 0) < pool.capacity]
+    if not available:
+        return None, "No available ports in the defined range."
+    return min(available, key=lambda pool: usage.get(pool.name, 0) / pool.capacity), None
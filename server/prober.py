@@ -0,0 +1,227 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+
+logger = logging.getLogger("ProberLogger")
+
+# Host probed for tunnels whose port is outside every allocation pool, and for pools served from this host
+PROBE_HOST = os.getenv("PROBE_HOST", "127.0.0.1")
+
+# Maximum number of TCP connects in flight at once
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", "500"))
+
+# Seconds to wait for a single connect before marking the tunnel unreachable
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "1.0"))
+
+# Seconds after which a cache entry is stale and due for a re-probe
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "60"))
+
+# Maximum number of tunnels probed per incremental round
+PROBE_BATCH = int(os.getenv("PROBE_BATCH", "2000"))
+
+# Seconds between reloads of the tunnel list from the database
+PROBE_RELOAD = float(os.getenv("PROBE_RELOAD", "30"))
+
+async def probe(host, port, timeout=PROBE_TIMEOUT):
+    """
+    Check whether a TCP connection to host:port can be opened.
+    Args:
+        host (str): Host to connect to.
+        port (int): Port to connect to.
+        timeout (float): Connect timeout in seconds.
+    Returns:
+        tuple: (reachable, latency_ms); latency is None if the tunnel is unreachable.
+    """
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False, None
+    latency = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True, latency
+
+async def probe_many(targets, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """
+    Probe many (host, port) targets with at most `concurrency` connects in flight.
+    Args:
+        targets (list): (host, port) tuples.
+        concurrency (int): Maximum number of concurrent connects.
+        timeout (float): Connect timeout in seconds.
+    Returns:
+        list: (reachable, latency_ms) tuples in the order of `targets`.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(host, port):
+        async with semaphore:
+            return await probe(host, port, timeout)
+
+    return await asyncio.gather(*(bounded(host, port) for host, port in targets))
+
+class ReachabilityCache:
+    """
+    In-memory reachability state of every allocated tunnel, keyed by unique_id.
+    Entries that were never probed sort before all others, so new tunnels are checked first.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sync(self, tunnels):
+        """
+        Align the cache with the current set of tunnels, keeping results of known ones.
+        Args:
+            tunnels (list): (unique_id, ipv6_address, host, port) tuples.
+        """
+        entries = {}
+        for unique_id, ipv6_address, host, port in tunnels:
+            entry = self._entries.get(unique_id)
+            if entry is None or entry["port"] != port or entry["host"] != host:
+                entry = {"unique_id": unique_id, "ipv6_address": ipv6_address, "host": host, "port": port,
+                         "reachable": None, "latency_ms": None, "checked_at": None}
+            entries[unique_id] = entry
+        self._entries = entries
+
+    def due(self, limit, max_age=PROBE_INTERVAL):
+        """
+        Args:
+            limit (int): Maximum number of entries to return.
+            max_age (float): Entries checked more recently than this are not due.
+        Returns:
+            list[dict]: Up to `limit` due entries, stalest first.
+        """
+        cutoff = time.time() - max_age
+        due = (entry for entry in self._entries.values()
+               if entry["checked_at"] is None or entry["checked_at"] <= cutoff)
+        return heapq.nsmallest(limit, due, key=lambda entry: entry["checked_at"] or 0.0)
+
+    def record(self, entry, reachable, latency_ms):
+        entry["reachable"] = reachable
+        entry["latency_ms"] = round(latency_ms, 2) if latency_ms is not None else None
+        entry["checked_at"] = time.time()
+
+    def get(self, unique_id):
+        return self._entries.get(unique_id)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Number of tunnels by state (reachable, unreachable, unknown).
+        """
+        counts = {"total": len(self._entries), "reachable": 0, "unreachable": 0, "unknown": 0}
+        for entry in self._entries.values():
+            if entry["reachable"] is None:
+                counts["unknown"] += 1
+            elif entry["reachable"]:
+                counts["reachable"] += 1
+            else:
+                counts["unreachable"] += 1
+        return counts
+
+    def entries(self, reachable=None):
+        """
+        Args:
+            reachable (bool): Only return entries in this state; None returns all of them.
+        Returns:
+            list[dict]: Copies of the matching entries.
+        """
+        return [dict(entry) for entry in self._entries.values()
+                if reachable is None or entry["reachable"] is reachable]
+
+class TunnelProber:
+    """
+    Keeps a ReachabilityCache fresh by re-probing its stalest entries in bounded batches.
+    """
+
+    def __init__(self, load_tunnels, cache=None, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT,
+                 interval=PROBE_INTERVAL, batch=PROBE_BATCH, reload=PROBE_RELOAD):
+        """
+        Args:
+            load_tunnels (callable): Returns (unique_id, ipv6_address, host, port) tuples of all tunnels.
+            cache (ReachabilityCache): Cache to maintain; a new one is created if not given.
+            concurrency (int): Maximum number of concurrent connects.
+            timeout (float): Connect timeout in seconds.
+            interval (float): Age after which an entry is re-probed.
+            batch (int): Maximum number of tunnels probed per round.
+            reload (float): Seconds between reloads of the tunnel list.
+        """
+        self.load_tunnels = load_tunnels
+        self.cache = cache if cache is not None else ReachabilityCache()
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.interval = interval
+        self.batch = batch
+        self.reload = reload
+
+    async def refresh_targets(self):
+        loop = asyncio.get_running_loop()
+        tunnels = await loop.run_in_executor(None, self.load_tunnels)
+        self.cache.sync(tunnels)
+
+    async def run_round(self):
+        """
+        Probe the stalest due entries once.
+        Returns:
+            int: Number of tunnels probed.
+        """
+        due = self.cache.due(self.batch, self.interval)
+        if not due:
+            return 0
+        results = await probe_many([(entry["host"], entry["port"]) for entry in due],
+                                   self.concurrency, self.timeout)
+        for entry, (reachable, latency_ms) in zip(due, results):
+            self.cache.record(entry, reachable, latency_ms)
+        return len(due)
+
+    async def run_forever(self):
+        """Reload tunnels and probe due entries until cancelled."""
+        last_reload = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_reload >= self.reload:
+                    await self.refresh_targets()
+                    last_reload = time.monotonic()
+                start = time.perf_counter()
+                probed = await self.run_round()
+                if probed:
+                    logger.info(f"Probed {probed} tunnels in {time.perf_counter() - start:.2f} s.")
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Tunnel probe round failed: {e}")
+            await asyncio.sleep(1)
+
+def database_tunnels():
+    """
+    Load every allocated tunnel from the client registry, probed on the probe host of its pool.
+    Tunnels of pools without a probe host (loopback listeners on a remote tunnel host) are skipped.
+    Returns:
+        list: (unique_id, ipv6_address, host, port) tuples.
+    """
+    from database import SessionLocal, ClientData
+    from pools import load_pools, pool_for_port
+
+    pools = load_pools()
+    session = SessionLocal()
+    try:
+        rows = session.query(ClientData.unique_id, ClientData.ipv6_address, ClientData.port).all()
+        tunnels = []
+        for unique_id, ipv6_address, port in rows:
+            pool = pool_for_port(pools, port)
+            host = pool.probe_host if pool else PROBE_HOST
+            if host is not None:
+                tunnels.append((unique_id, ipv6_address, host, port))
+        return tunnels
+    finally:
+        session.close()
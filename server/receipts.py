@@ -0,0 +1,80 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+
+logger = logging.getLogger("ReceiptsLogger")
+
+# Seconds a lease receipt stays valid after it is issued
+RECEIPT_TTL = int(os.getenv("RECEIPT_TTL", "86400"))
+
+# Seconds after expiry during which an expired receipt can still be renewed
+RECEIPT_RENEW_GRACE = int(os.getenv("RECEIPT_RENEW_GRACE", str(7 * 86400)))
+
+class ReceiptError(ValueError):
+    """Raised when a lease receipt is malformed, forged or expired."""
+
+def _receipt_key():
+    # Every worker must sign with the same key; without RECEIPT_SECRET it is derived from the TOTP secret
+    secret = os.getenv("RECEIPT_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    totp_secret = os.getenv("TOTP_SECRET")
+    if not totp_secret:
+        raise SystemExit("RECEIPT_SECRET or TOTP_SECRET environment variable is required but not set.")
+    logger.warning("RECEIPT_SECRET not set. Deriving the receipt signing key from TOTP_SECRET.")
+    return hmac.new(totp_secret.encode("utf-8"), b"drta-lease-receipt", hashlib.sha256).digest()
+
+RECEIPT_KEY = _receipt_key()
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload):
+    return hmac.new(RECEIPT_KEY, payload.encode("ascii"), hashlib.sha256).digest()
+
+def issue_receipt(unique_id, port, ipv6_address, ttl=RECEIPT_TTL):
+    """
+    Issue a signed lease receipt binding a client's unique_id, port and address.
+    Args:
+        unique_id (str): Client unique ID.
+        port (int): Allocated tunnel port.
+        ipv6_address (str): Allocated IPv6 address.
+        ttl (int): Validity in seconds.
+    Returns:
+        tuple: (receipt, expires) where receipt is "<payload>.<signature>" and expires a Unix timestamp.
+    """
+    expires = int(time.time()) + ttl
+    payload = _b64encode(json.dumps(
+        {"u": unique_id, "p": port, "a": ipv6_address, "e": expires}, separators=(",", ":")
+    ).encode("utf-8"))
+    return f"{payload}.{_b64encode(_sign(payload))}", expires
+
+def verify_receipt(receipt, grace=0):
+    """
+    Verify a lease receipt without touching the database.
+    Args:
+        receipt (str): Receipt returned by issue_receipt.
+        grace (int): Seconds past expiry for which the receipt is still accepted (used for renewals).
+    Returns:
+        dict: Receipt contents with keys unique_id, port, ipv6_address and expires.
+    Raises:
+        ReceiptError: If the receipt is malformed, its signature is invalid or it has expired.
+    """
+    try:
+        payload, signature = (receipt or "").split(".")
+        valid = hmac.compare_digest(_sign(payload), _b64decode(signature))
+    except (ValueError, UnicodeEncodeError):
+        raise ReceiptError("Malformed receipt.")
+    if not valid:
+        raise ReceiptError("Invalid receipt signature.")
+    claims = json.loads(_b64decode(payload))
+    if claims["e"] + grace < time.time():
+        raise ReceiptError("Receipt expired.")
+    return {"unique_id": claims["u"], "port": claims["p"], "ipv6_address": claims["a"], "expires": claims["e"]}
@@ -0,0 +1,523 @@
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import array
+import bisect
+import fcntl
+import socket
+import struct
+import hashlib
+import asyncio
+import logging
+import argparse
+import tempfile
+
+logger = logging.getLogger("RegistrySnapshotLogger")
+
+# Directory snapshots are published to (and read from on lookup replicas)
+SNAPSHOT_DIR = os.getenv("REGISTRY_SNAPSHOT_DIR", "./snapshots")
+
+# Number of published snapshot versions kept in the directory
+SNAPSHOT_KEEP = int(os.getenv("REGISTRY_SNAPSHOT_KEEP", "3"))
+
+# Seconds between checks of the CURRENT pointer by the lookup service
+SNAPSHOT_POLL = float(os.getenv("REGISTRY_SNAPSHOT_POLL", "1"))
+
+# Address the read-only lookup service listens on
+LOOKUP_HOST = os.getenv("REGISTRY_LOOKUP_HOST", "127.0.0.1")
+LOOKUP_PORT = int(os.getenv("REGISTRY_LOOKUP_PORT", "7070"))
+
+# Timeout in seconds for a query against the lookup service
+LOOKUP_TIMEOUT = 2.0
+
+# File layout (version 2). Sections are 8-byte aligned; integers are little endian.
+#   header     HEADER
+#   ports      u32 * count, sorted; position i is record i
+#   uid_keys   u64 * count, sorted 64-bit hashes of unique_id
+#   uid_rows   u32 * count, record index for each uid_keys entry
+#   ip_keys    u64 * ip_count, sorted 64-bit hashes of the packed IPv6 address
+#   ip_rows    u32 * ip_count, record index for each ip_keys entry
+# ip_count <= count: clients whose address is not a valid IPv6 address (legacy free-form
+# prefixes) are found by port and unique_id but left out of the IPv6 index.
+#   records    RECORD * count, in port order; strings are (offset, length) into the string table
+#   strings    UTF-8 string table
+# The key arrays are searched in place with bisect over memoryview casts; hash collisions are
+# resolved by comparing the record itself. The CRC covers everything after the header.
+MAGIC = b"DRTASNAP"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sIIQQQQQQQQQQII")
+RECORD = struct.Struct("<QIIIIIIIIIIIII")
+
+POINTER_FILE = "CURRENT"
+LOCK_FILE = ".publish.lock"
+
+SNAPSHOT_QUERY = """
+    SELECT id, port, ipv6_address, unique_id, device_name, location, function, pool
+    FROM client_data ORDER BY port
+"""
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is missing, truncated, corrupt or of an unknown format."""
+
+def snapshot_name(generation):
+    return f"registry-{generation:012d}.snap"
+
+def _key(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def _pack_ipv6(ipv6_address):
+    try:
+        return socket.inet_pton(socket.AF_INET6, ipv6_address)
+    except (OSError, TypeError):
+        return None
+
+def _array(typecode, values):
+    values = array.array(typecode, values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+def build_body(rows):
+    """
+    Lay out the sections of a snapshot.
+    Args:
+        rows (iterable): (id, port, ipv6_address, unique_id, device_name, location, function, pool) tuples.
+    Returns:
+        tuple: (count, offsets, body) where offsets are the file offsets of the seven sections and the file size.
+    """
+    strings = []
+    size = 0
+    interned = {}
+    ports, uid_keys, ip_entries, records = [], [], [], []
+    for row_id, port, ipv6_address, unique_id, device_name, location, function, pool in rows:
+        packed = _pack_ipv6(ipv6_address)
+        if packed is not None:
+            ip_entries.append((_key(packed), len(records)))
+        ipv6_bytes, unique_id_bytes, name_bytes = (
+            ipv6_address.encode("utf-8"), unique_id.encode("utf-8"), device_name.encode("utf-8")
+        )
+        refs = [size, len(ipv6_bytes), size + len(ipv6_bytes), len(unique_id_bytes),
+                size + len(ipv6_bytes) + len(unique_id_bytes), len(name_bytes)]
+        strings += (ipv6_bytes, unique_id_bytes, name_bytes)
+        size += refs[1] + refs[3] + refs[5]
+        # Locations, functions and pools repeat across the fleet and are stored once
+        for value in (location, function, pool or ""):
+            ref = interned.get(value)
+            if ref is None:
+                encoded = value.encode("utf-8")
+                ref = interned[value] = (size, len(encoded))
+                strings.append(encoded)
+                size += len(encoded)
+            refs += ref
+        ports.append(port)
+        uid_keys.append(_key(unique_id_bytes))
+        records.append(RECORD.pack(row_id, port, *refs))
+    if any(ports[i] >= ports[i + 1] for i in range(len(ports) - 1)):
+        raise ValueError("Snapshot rows must be ordered by unique port.")
+
+    count = len(records)
+    uid_order = sorted(range(count), key=uid_keys.__getitem__)
+    if len(ip_entries) < count:
+        logger.warning(f"{count - len(ip_entries)} clients without a valid IPv6 address are left out of the IPv6 index.")
+    ip_entries.sort()
+    sections = [
+        _array("I", ports),
+        _array("Q", (uid_keys[i] for i in uid_order)),
+        _array("I", uid_order),
+        _array("Q", (key for key, _ in ip_entries)),
+        _array("I", (index for _, index in ip_entries)),
+        b"".join(records),
+        b"".join(strings),
+    ]
+
+    body = bytearray()
+    offsets = []
+    for section in sections:
+        body += bytes(-(HEADER.size + len(body)) % 8)
+        offsets.append(HEADER.size + len(body))
+        body += section
+    offsets.append(HEADER.size + len(body))
+    return count, tuple(offsets), bytes(body)
+
+def read_pointer(directory=SNAPSHOT_DIR):
+    """
+    Returns:
+        str: Path of the current snapshot, or None if nothing was published yet.
+    """
+    try:
+        with open(os.path.join(directory, POINTER_FILE), "r") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _snapshot_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("registry-") and name.endswith(".snap"))
+
+def _prune(directory, keep):
+    names = _snapshot_files(directory)
+    for name in names[:-keep] if keep > 0 else []:
+        # Replicas still mapping an old version keep reading it; the inode lives until they unmap it
+        os.unlink(os.path.join(directory, name))
+
+def publish_snapshot(conn, directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """
+    Write a new snapshot of client_data and point CURRENT at it.
+    The snapshot file is complete and fsynced before the pointer is replaced, so readers
+    never see a partial version. Nothing is written if the registry did not change.
+    Args:
+        conn: DBAPI connection to the registry database.
+        directory (str): Snapshot directory.
+        keep (int): Number of versions to keep.
+    Returns:
+        int: Generation of the new snapshot, or None if the current one is still up to date.
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Only one publisher at a time, even with several server workers sharing the directory
+    with open(os.path.join(directory, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        count, offsets, body = build_body(conn.execute(SNAPSHOT_QUERY))
+        crc = zlib.crc32(body)
+
+        current = read_pointer(directory)
+        if current and os.path.exists(current):
+            with open(current, "rb") as f:
+                previous = f.read()
+            if len(previous) >= HEADER.size:
+                magic, version, previous_count, *_, previous_crc, _ = HEADER.unpack_from(previous)
+                if ((magic, version, previous_count, previous_crc) == (MAGIC, FORMAT_VERSION, count, crc)
+                        and previous[HEADER.size:] == body):
+                    return None
+        generation = max((int(name[9:21]) for name in _snapshot_files(directory)), default=0) + 1
+
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, count, generation, int(time.time() * 1000), *offsets, crc, 0)
+        _write_atomic(os.path.join(directory, snapshot_name(generation)), header + body)
+        _write_atomic(os.path.join(directory, POINTER_FILE), (snapshot_name(generation) + "\n").encode("ascii"))
+        _prune(directory, keep)
+    logger.info(f"Published registry snapshot {generation} with {count} clients.")
+    return generation
+
+class RegistrySnapshot:
+    """
+    Read-only view of one snapshot file, memory-mapped and searched in place.
+    The sorted key arrays are exposed as memoryview casts of the mapping and searched with
+    bisect, so nothing is deserialized up front and pages are shared between all processes
+    mapping the file.
+    """
+
+    def __init__(self, path, verify=True):
+        """
+        Args:
+            path (str): Snapshot file.
+            verify (bool): Check the CRC of the whole file before using it.
+        Raises:
+            SnapshotError: If the file is not a valid snapshot.
+        """
+        if sys.byteorder != "little":
+            raise SnapshotError("Registry snapshots can only be mapped on little endian hosts.")
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise SnapshotError(f"{path} is truncated.")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.count, self.generation, created_ms,
+             *offsets, end, crc, _) = HEADER.unpack_from(self._mm)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise SnapshotError(f"{path} is not a version {FORMAT_VERSION} registry snapshot.")
+            if end != size:
+                raise SnapshotError(f"{path} is truncated.")
+            if verify:
+                with memoryview(self._mm) as view, view[HEADER.size:] as payload:
+                    if zlib.crc32(payload) != crc:
+                        raise SnapshotError(f"{path} failed its checksum.")
+        except BaseException:
+            self._mm.close()
+            raise
+        self.created = created_ms / 1000
+        self._records, self._strings = offsets[5], offsets[6]
+        view = memoryview(self._mm)
+        self._views = [view]
+
+        def cast(offset, typecode, count=self.count):
+            section = view[offset:offset + count * struct.calcsize(typecode)].cast(typecode)
+            self._views.append(section)
+            return section
+
+        self._ports = cast(offsets[0], "I")
+        self._uid_keys, self._uid_rows = cast(offsets[1], "Q"), cast(offsets[2], "I")
+        ip_count = (offsets[4] - offsets[3]) // 8  # The u64 section needs no padding after it
+        self._ip_keys, self._ip_rows = cast(offsets[3], "Q", ip_count), cast(offsets[4], "I", ip_count)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def record(self, index):
+        """
+        Args:
+            index (int): Record position in port order.
+        Returns:
+            dict: Client row.
+        """
+        row_id, port, *refs = RECORD.unpack_from(self._mm, self._records + index * RECORD.size)
+        ipv6_address, unique_id, device_name, location, function, pool = (
+            self._string(refs[i], refs[i + 1]) for i in range(0, 12, 2)
+        )
+        return {
+            "id": row_id,
+            "port": port,
+            "ipv6_address": ipv6_address,
+            "unique_id": unique_id,
+            "device_name": device_name,
+            "location": location,
+            "function": function,
+            "pool": pool or None,
+        }
+
+    def _find(self, keys, rows, key, matches):
+        position = bisect.bisect_left(keys, key)
+        while position < len(keys) and keys[position] == key:
+            if matches(rows[position]):
+                return self.record(rows[position])
+            position += 1
+        return None
+
+    def by_port(self, port):
+        port = int(port)
+        index = bisect.bisect_left(self._ports, port)
+        return self.record(index) if index < self.count and self._ports[index] == port else None
+
+    def by_unique_id(self, unique_id):
+        encoded = unique_id.encode("utf-8")
+
+        def matches(index):
+            offset, length = struct.unpack_from("<II", self._mm, self._records + index * RECORD.size + 20)
+            start = self._strings + offset
+            return self._mm[start:start + length] == encoded
+
+        return self._find(self._uid_keys, self._uid_rows, _key(encoded), matches)
+
+    def by_ipv6(self, ipv6_address):
+        packed = _pack_ipv6(ipv6_address)
+        if packed is None:
+            return None
+
+        def matches(index):
+            offset, length = struct.unpack_from("<II", self._mm, self._records + index * RECORD.size + 12)
+            return _pack_ipv6(self._string(offset, length)) == packed
+
+        return self._find(self._ip_keys, self._ip_rows, _key(packed), matches)
+
+class SnapshotReader:
+    """
+    Follows the CURRENT pointer of a snapshot directory and hot-swaps to new versions.
+    A new version is mapped and verified before it replaces the old one; lookups hold a
+    reference to the snapshot they started on, so a swap never interrupts them.
+    """
+
+    LOOKUPS = {"port": "by_port", "unique_id": "by_unique_id", "ipv6": "by_ipv6"}
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self.snapshot = None
+        self._rejected = None  # (path, stat signature) of a version that failed validation
+        self._unavailable = None  # Path of a version that could not be opened, logged once
+
+    def refresh(self):
+        """
+        Switch to the current version if it changed.
+        Returns:
+            bool: True if a new snapshot was mapped.
+        """
+        path = read_pointer(self.directory)
+        if path is None or (self.snapshot is not None and self.snapshot.path == path):
+            return False
+        try:
+            st = os.stat(path)
+            signature = (path, st.st_ino, st.st_size, st.st_mtime_ns)
+            if signature == self._rejected:
+                return False  # Unchanged since it failed validation; retried once the file is replaced
+            snapshot = RegistrySnapshot(path)
+        except SnapshotError as e:
+            logger.error(f"Cannot map registry snapshot {path}, keeping the previous one: {e}")
+            self._rejected = signature
+            return False
+        except OSError as e:
+            # Typically CURRENT was synced before its snapshot file; retried on every poll
+            if path != self._unavailable:
+                logger.warning(f"Registry snapshot {path} is not available yet, keeping the previous one: {e}")
+                self._unavailable = path
+            return False
+        # The previous mapping is released once the last lookup using it drops its reference
+        self.snapshot = snapshot
+        logger.info(f"Serving registry snapshot {snapshot.generation} with {len(snapshot)} clients.")
+        return True
+
+    def lookup(self, kind, value):
+        """
+        Args:
+            kind (str): "port", "unique_id" or "ipv6".
+            value (str): Value to look up.
+        Returns:
+            dict: Client row, or None if not found.
+        Raises:
+            SnapshotError: If no snapshot is available yet.
+            ValueError: If the kind or value is invalid.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise SnapshotError("No registry snapshot published yet.")
+        if kind not in self.LOOKUPS:
+            raise ValueError(f"Unknown lookup {kind!r}. Allowed: {', '.join(self.LOOKUPS)}.")
+        return getattr(snapshot, self.LOOKUPS[kind])(value)
+
+    def status(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"generation": None, "clients": 0, "created": None}
+        return {"generation": snapshot.generation, "clients": len(snapshot), "created": snapshot.created}
+
+async def serve(reader, host=LOOKUP_HOST, port=LOOKUP_PORT, poll=SNAPSHOT_POLL):
+    """
+    Serve lookups over TCP: one "<kind> <value>" query per line in, one JSON object per line out.
+    "version" returns the generation being served.
+    Args:
+        reader (SnapshotReader): Snapshot reader to answer from.
+        host (str): Listen address.
+        port (int): Listen port.
+        poll (float): Seconds between checks for a new snapshot.
+    """
+    loop = asyncio.get_running_loop()
+
+    def answer(query):
+        kind, _, value = query.strip().partition(" ")
+        if kind == "version":
+            return reader.status()
+        try:
+            return {"client": reader.lookup(kind, value.strip())}
+        except (SnapshotError, ValueError) as e:
+            return {"error": str(e)}
+
+    async def handle(stream_reader, writer):
+        try:
+            while True:
+                request = await stream_reader.readline()
+                if not request:
+                    break
+                response = answer(request.decode("utf-8", "replace"))
+                writer.write((json.dumps(response, separators=(",", ":")) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def poll_loop():
+        while True:
+            await asyncio.sleep(poll)
+            try:
+                # Mapping and verifying a new version runs off the event loop; the swap is a single assignment
+                await loop.run_in_executor(None, reader.refresh)
+            except Exception as e:
+                logger.error(f"Failed to refresh registry snapshot: {e}")
+
+    await loop.run_in_executor(None, reader.refresh)
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving registry lookups on {host}:{port}.")
+    poller = asyncio.create_task(poll_loop())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        poller.cancel()
+
+def query(request, host=LOOKUP_HOST, port=LOOKUP_PORT):
+    """
+    Send one query to the lookup service.
+    Args:
+        request (str): "<kind> <value>" or "version".
+    Returns:
+        dict: Decoded response.
+    """
+    with socket.create_connection((host, port), timeout=LOOKUP_TIMEOUT) as sock:
+        sock.sendall((request + "\n").encode("utf-8"))
+        response = b""
+        while not response.endswith(b"\n"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+    return json.loads(response)
+
+def main():
+    """
+    Command line entry point.
+    `publish` writes one snapshot from the database, `serve` runs the lookup service on a
+    replica and `get` queries it.
+    """
+    parser = argparse.ArgumentParser(description="Memory-mapped registry snapshots for DRTA lookup replicas.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("publish", help="Publish a snapshot of the client registry.")
+    subparsers.add_parser("serve", help="Run the read-only lookup service.")
+    get_parser = subparsers.add_parser("get", help="Look up a client in the lookup service.")
+    get_parser.add_argument("kind", choices=["port", "unique_id", "ipv6", "version"])
+    get_parser.add_argument("value", nargs="?", default="")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "publish":
+        from database import engine
+        conn = engine.raw_connection()
+        try:
+            generation = publish_snapshot(conn)
+        finally:
+            conn.close()
+        print(f"[INFO] Published snapshot {generation}." if generation else "[INFO] Snapshot is up to date.")
+        return
+
+    if args.command == "serve":
+        asyncio.run(serve(SnapshotReader()))
+        return
+
+    try:
+        response = query(f"{args.kind} {args.value}".strip())
+    except OSError as e:
+        print(f"[ERROR] Lookup service unavailable: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(response, indent=4))
+
+if __name__ == "__main__":
+    main()
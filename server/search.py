@@ -0,0 +1,181 @@
+import re
+import logging
+import sqlite3
+from functools import lru_cache
+
+logger = logging.getLogger("SearchLogger")
+
+# Columns of client_data covered by the fleet search index
+SEARCH_COLUMNS = ("device_name", "location", "function")
+
+# Upper bound on rows returned by a single search
+SEARCH_LIMIT_MAX = 500
+
+# External-content FTS5 index over client_data, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS client_data_fts USING fts5(
+    device_name, location, function,
+    content='client_data', content_rowid='id',
+    tokenize="unicode61 tokenchars '-_.'"
+)
+"""
+
+FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS client_data_fts_ai AFTER INSERT ON client_data BEGIN
+        INSERT INTO client_data_fts(rowid, device_name, location, function)
+        VALUES (new.id, new.device_name, new.location, new.function);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_data_fts_ad AFTER DELETE ON client_data BEGIN
+        INSERT INTO client_data_fts(client_data_fts, rowid, device_name, location, function)
+        VALUES ('delete', old.id, old.device_name, old.location, old.function);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS client_data_fts_au AFTER UPDATE OF device_name, location, function ON client_data BEGIN
+        INSERT INTO client_data_fts(client_data_fts, rowid, device_name, location, function)
+        VALUES ('delete', old.id, old.device_name, old.location, old.function);
+        INSERT INTO client_data_fts(rowid, device_name, location, function)
+        VALUES (new.id, new.device_name, new.location, new.function);
+    END
+    """,
+)
+
+@lru_cache(maxsize=256)
+def _compile_pattern(pattern):
+    return re.compile(pattern)
+
+def regexp(pattern, value):
+    """
+    Implementation of the SQL REGEXP operator (`value REGEXP pattern`).
+    Compiled patterns are cached, so a query only compiles its pattern once
+    instead of once per scanned row.
+    Args:
+        pattern (str): Regular expression.
+        value (str): Column value to test.
+    Returns:
+        bool: True if the pattern matches anywhere in the value.
+    """
+    if pattern is None or value is None:
+        return False
+    return _compile_pattern(pattern).search(value) is not None
+
+def fts_available(conn):
+    """
+    Check whether the SQLite build behind the connection supports FTS5.
+    Args:
+        conn: DBAPI connection to the database.
+    Returns:
+        bool: True if FTS5 virtual tables can be used.
+    """
+    try:
+        row = conn.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()
+        return bool(row and row[0])
+    except sqlite3.Error:
+        return False
+
+def fts_exists(conn):
+    """
+    Check whether the fleet search index has been created in the database.
+    Args:
+        conn: DBAPI connection to the database.
+    Returns:
+        bool: True if the client_data_fts table exists.
+    """
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='client_data_fts'"
+    ).fetchone()
+    return row is not None
+
+def install_fts(conn):
+    """
+    Create the fleet search index and its sync triggers if they do not exist yet.
+    A freshly created index is populated from the rows already in client_data.
+    Args:
+        conn: DBAPI connection to the database.
+    Returns:
+        bool: True if the FTS index is in place, False if FTS5 is unavailable.
+    """
+    if not fts_available(conn):
+        logger.warning("FTS5 is not available in this SQLite build. Fleet search falls back to LIKE scans.")
+        return False
+
+    exists = fts_exists(conn)
+    conn.execute(FTS_SCHEMA)
+    for statement in FTS_TRIGGERS:
+        conn.execute(statement)
+    if not exists:
+        logger.info("Building fleet search index from existing client data...")
+        conn.execute("INSERT INTO client_data_fts(client_data_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+def _fts_term(term):
+    # Quote every token so user input cannot inject FTS5 query syntax; '*' makes it a prefix match.
+    return '"' + term.replace('"', '""') + '"*'
+
+def build_match_query(query=None, **fields):
+    """
+    Build an FTS5 MATCH expression from a free-text query and per-column filters.
+    Args:
+        query (str): Free text matched against all indexed columns.
+        **fields: Column name to text pairs, restricted to SEARCH_COLUMNS.
+    Returns:
+        str: MATCH expression, or None if there is nothing to match.
+    """
+    clauses = [_fts_term(term) for term in (query or "").split()]
+    for column, value in fields.items():
+        if column not in SEARCH_COLUMNS:
+            raise ValueError(f"Unsupported search column: {column}")
+        terms = (value or "").split()
+        if terms:
+            clauses.append(f"{column} : ({' '.join(_fts_term(term) for term in terms)})")
+    return " AND ".join(clauses) or None
+
+def _like_search(conn, query, fields, limit):
+    conditions, params = [], []
+    for term in (query or "").split():
+        conditions.append("(" + " OR ".join(f"{column} LIKE ?" for column in SEARCH_COLUMNS) + ")")
+        params.extend([f"%{term}%"] * len(SEARCH_COLUMNS))
+    for column, value in fields.items():
+        for term in (value or "").split():
+            conditions.append(f"{column} LIKE ?")
+            params.append(f"%{term}%")
+    where = " AND ".join(conditions) or "1"
+    return conn.execute(
+        f"SELECT id, device_name, ipv6_address, port, location, function, unique_id "
+        f"FROM client_data WHERE {where} ORDER BY id LIMIT ?",
+        params + [limit],
+    ).fetchall()
+
+def search_clients(conn, query=None, limit=50, **fields):
+    """
+    Search the fleet by device name, location and function.
+    Every whitespace separated term must match (as a prefix) for a row to be returned.
+    Args:
+        conn: DBAPI connection to the database.
+        query (str): Free text matched against all indexed columns.
+        limit (int): Maximum number of rows to return.
+        **fields: Optional per-column filters (device_name, location, function).
+    Returns:
+        list[dict]: Matching clients, best matches first.
+    """
+    limit = max(1, min(int(limit), SEARCH_LIMIT_MAX))
+    match = build_match_query(query, **fields)
+    if match is None:
+        return []
+
+    if fts_exists(conn):
+        rows = conn.execute(
+            "SELECT c.id, c.device_name, c.ipv6_address, c.port, c.location, c.function, c.unique_id "
+            "FROM client_data_fts JOIN client_data AS c ON c.id = client_data_fts.rowid "
+            "WHERE client_data_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        ).fetchall()
+    else:
+        rows = _like_search(conn, query, fields, limit)
+
+    keys = ("id", "device_name", "ipv6_address", "port", "location", "function", "unique_id")
+    return [dict(zip(keys, row)) for row in rows]
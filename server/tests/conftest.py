@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Server modules import each other by plain module name (they run from the server directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,144 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from registry_snapshot import (
+    HEADER, POINTER_FILE, RegistrySnapshot, SnapshotError, SnapshotReader, publish_snapshot, read_pointer,
+)
+
+CLIENTS = [
+    (1, "gateway-1", "fd:fc:fb::1", 8001, "kosice", "gateway", "0000000000000000000a", "node-1"),
+    (2, "camera-2", "fd:fc:fb::2", 8002, "kosice", "camera", "0000000000000000000b", "node-1"),
+    (3, "sensor-3", "fd:ab:cd::3", 9001, "zilina", "sensor", "0000000000000000000c", None),
+]
+
+@pytest.fixture
+def registry():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE client_data (id INTEGER PRIMARY KEY, device_name VARCHAR, ipv6_address VARCHAR, "
+        "port INTEGER, location VARCHAR, function VARCHAR, unique_id VARCHAR, pool VARCHAR)"
+    )
+    yield conn
+    conn.close()
+
+def add_clients(conn, clients):
+    conn.executemany("INSERT INTO client_data VALUES (?, ?, ?, ?, ?, ?, ?, ?)", clients)
+    conn.commit()
+
+def mapped(directory):
+    reader = SnapshotReader(str(directory))
+    assert reader.refresh()
+    return reader
+
+def test_round_trip_lookups(registry, tmp_path):
+    add_clients(registry, CLIENTS)
+    assert publish_snapshot(registry, str(tmp_path)) == 1
+    reader = mapped(tmp_path)
+
+    assert len(reader.snapshot) == 3
+    assert reader.lookup("port", 8002) == {
+        "id": 2, "port": 8002, "ipv6_address": "fd:fc:fb::2", "unique_id": "0000000000000000000b",
+        "device_name": "camera-2", "location": "kosice", "function": "camera", "pool": "node-1",
+    }
+    assert reader.lookup("port", "9001")["pool"] is None
+    assert reader.lookup("unique_id", "0000000000000000000a")["port"] == 8001
+    assert reader.lookup("ipv6", "fd:ab:cd:0:0:0:0:3")["unique_id"] == "0000000000000000000c"
+
+    assert reader.lookup("port", 8003) is None
+    assert reader.lookup("unique_id", "missing") is None
+    assert reader.lookup("ipv6", "fd:fc:fb::9") is None
+    assert reader.lookup("ipv6", "not-an-address") is None
+    with pytest.raises(ValueError):
+        reader.lookup("device_name", "camera-2")
+
+def test_free_form_addresses_are_kept(registry, tmp_path):
+    add_clients(registry, CLIENTS + [
+        (4, "legacy-4", "default_prefix:0000:0000:0000:0000:0004", 8004, "nitra", "plc", "0000000000000000000d", None),
+        (5, "legacy-5", "fd:fc:fb:fa::/48:0000:0000:0000:0000:0005", 8005, "nitra", "plc", "0000000000000000000e", None),
+    ])
+    publish_snapshot(registry, str(tmp_path))
+    reader = mapped(tmp_path)
+
+    assert len(reader.snapshot) == 5
+    assert reader.lookup("port", 8004)["ipv6_address"] == "default_prefix:0000:0000:0000:0000:0004"
+    assert reader.lookup("unique_id", "0000000000000000000e")["port"] == 8005
+    assert reader.lookup("ipv6", "fd:fc:fb::1")["port"] == 8001
+
+def test_empty_registry(registry, tmp_path):
+    assert publish_snapshot(registry, str(tmp_path)) == 1
+    reader = mapped(tmp_path)
+
+    assert len(reader.snapshot) == 0
+    assert reader.lookup("port", 8001) is None
+    assert reader.lookup("unique_id", "0000000000000000000a") is None
+    assert reader.lookup("ipv6", "fd:fc:fb::1") is None
+
+def test_unchanged_registry_is_not_republished(registry, tmp_path):
+    add_clients(registry, CLIENTS)
+    assert publish_snapshot(registry, str(tmp_path)) == 1
+    assert publish_snapshot(registry, str(tmp_path)) is None
+    reader = mapped(tmp_path)
+
+    registry.execute("UPDATE client_data SET device_name = 'gateway-renamed' WHERE id = 1")
+    assert publish_snapshot(registry, str(tmp_path)) == 2
+    previous = reader.snapshot
+    assert reader.refresh()
+    assert reader.lookup("port", 8001)["device_name"] == "gateway-renamed"
+    assert previous.by_port(8001)["device_name"] == "gateway-1"  # Old version stays readable until released
+
+def test_keep_prunes_old_versions(registry, tmp_path):
+    for client in CLIENTS:
+        add_clients(registry, [client])
+        publish_snapshot(registry, str(tmp_path), keep=2)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".snap")) == [
+        "registry-000000000002.snap", "registry-000000000003.snap",
+    ]
+
+@pytest.mark.parametrize("damage", ["truncate", "flip"])
+def test_damaged_file_is_rejected_until_replaced(registry, tmp_path, damage):
+    add_clients(registry, CLIENTS)
+    source = tmp_path / "source"
+    replica = tmp_path / "replica"
+    publish_snapshot(registry, str(source))
+    path = read_pointer(str(source))
+    data = open(path, "rb").read()
+    damaged = bytearray(data[:HEADER.size + 10] if damage == "truncate" else data)
+    if damage == "flip":
+        damaged[-1] ^= 0xFF
+
+    replica.mkdir()
+    shutil.copy(source / POINTER_FILE, replica / POINTER_FILE)
+    replica_path = replica / os.path.basename(path)
+    replica_path.write_bytes(bytes(damaged))
+    with pytest.raises(SnapshotError):
+        RegistrySnapshot(str(replica_path))
+
+    reader = SnapshotReader(str(replica))
+    assert not reader.refresh()
+    assert reader.snapshot is None
+    with pytest.raises(SnapshotError):
+        reader.lookup("port", 8001)
+
+    replica_path.write_bytes(data)
+    assert reader.refresh()
+    assert reader.lookup("port", 8001)["unique_id"] == "0000000000000000000a"
+
+def test_pointer_ahead_of_snapshot_file_is_retried(registry, tmp_path):
+    add_clients(registry, CLIENTS)
+    source = tmp_path / "source"
+    replica = tmp_path / "replica"
+    publish_snapshot(registry, str(source))
+    replica.mkdir()
+    shutil.copy(source / POINTER_FILE, replica / POINTER_FILE)
+
+    reader = SnapshotReader(str(replica))
+    assert not reader.refresh()
+    assert not reader.refresh()
+
+    path = read_pointer(str(source))
+    shutil.copy(path, replica / os.path.basename(path))
+    assert reader.refresh()
+    assert len(reader.snapshot) == 3